@@ -0,0 +1,110 @@
+"""
+Memory entry representations side by side: plain dicts (what the log holds), pydantic Entry models and the
+compact slotted rows the MemoryStore keeps.
+
+    cd backend && python -m benchmarks.entry_table_bench --sizes 1000 10000 100000
+
+Reports bytes per entry (tracemalloc) and construct throughput for each form, the cost of validating into
+pydantic lazily (only the k entries that reach the API), the whole MemoryStore's footprint per entry (rows plus
+the offset/category/status indexes, what a session actually holds) and MemoryStore.all() vs entries() per turn.
+"""
+import os
+import gc
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from uuid import UUID
+from benchmarks.workflow_bench import seed_memory, CATEGORIES
+
+def make_dicts(size):
+    return [
+        {
+            "id": str(UUID(int=i + 1)),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "content": f"Benchmark memory {i}: practice topic {i % 97} every week",
+            "status": "CreateMemory",
+            "details": [{"reason": f"reason {i % 13}"}, {"reason": f"because {i % 7}"}],
+        }
+        for i in range(size)
+    ]
+
+def measure(build):
+    """(result, seconds, bytes allocated and still alive)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, allocated
+
+def run_size(size, lazy_k=8):
+    from llm.core.signatures.knowledge_signature import Entry
+    from llm.core.memory.table import CompactEntry
+
+    source = make_dicts(size)
+    payload = json.dumps(source)
+    forms = {
+        # parsed from JSON, the way MemoryStore.all() used to hand memories to the graph.
+        "dict": lambda: json.loads(payload),
+        # built from freshly parsed dicts too, so every form pays for its own strings.
+        "pydantic": lambda: [Entry.model_validate(entry) for entry in json.loads(payload)],
+        "compact": lambda: [CompactEntry.from_dict(entry) for entry in json.loads(payload)],
+    }
+
+    result = {"size": size, "forms": {}}
+    for name, build in forms.items():
+        rows, seconds, allocated = measure(build)
+        result["forms"][name] = {
+            "bytes_per_entry": allocated / size,
+            "construct_per_s": size / seconds if seconds else 0.0,
+        }
+        if name == "compact":
+            start = time.perf_counter()
+            for row in rows[:lazy_k]:
+                row.to_entry()
+            result["lazy_validate_s"] = time.perf_counter() - start
+        del rows
+
+    with tempfile.TemporaryDirectory() as directory:
+        from llm.core.memory.store import MemoryStore
+        seed_memory(directory, "bench", size)
+        # opening the store builds every row and index, so this is its resident size.
+        store, _, allocated = measure(lambda: MemoryStore(os.path.join(directory, "bench.jsonl")))
+        result["store_bytes_per_entry"] = allocated / size
+        for method in ("all", "entries"):
+            start = time.perf_counter()
+            getattr(store, method)()
+            result[f"store_{method}_s"] = time.perf_counter() - start
+        store.close()
+    return result
+
+def print_result(result):
+    print(f"\n== {result['size']} entries ==")
+    for name, form in result["forms"].items():
+        print(f"  {name:<9} {form['bytes_per_entry']:8.0f} B/entry  {form['construct_per_s']:12.0f} entries/s")
+    print(f"  store     {result['store_bytes_per_entry']:8.0f} B/entry  (rows + indexes)")
+    print(f"  lazy pydantic for 8 entries: {result['lazy_validate_s'] * 1000:.2f}ms")
+    print(f"  store.all() {result['store_all_s'] * 1000:.1f}ms  store.entries() {result['store_entries_s'] * 1000:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and throughput of memory entry representations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = run_size(size)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import re
+import json
+import time
+import random
+import threading
+from uuid import uuid5, NAMESPACE_URL
+import dspy
+from llm.core.lm.cache import request_key
+
+_OUTPUT_FIELDS_RE = re.compile(r"Your output fields are:\n(.*?)\n\n", re.S)
+_FIELD_NAME_RE = re.compile(r"^\d+\. `(\w+)`", re.M)
+_INPUT_TEXT_RE = re.compile(r"\[\[ ## input_text ## \]\]\n(.*?)(?:\n\n|$)", re.S)
+_CONTEXT_RE = re.compile(r"\[\[ ## context ## \]\]\n(.*?)(?:\n\n|$)", re.S)
+
+IRRELEVANT_HINTS = ["weather", "movie", "cat video", "dinner", "groceries", "meeting with my friend"]
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for llama3 on english text.
+    return max(1, len(text or "") // 4)
+
+def scripted_fields(field_names, input_text, context=""):
+    """Deterministic answer for every output field our signatures ask for."""
+    relevant = not any(hint in input_text.lower() for hint in IRRELEVANT_HINTS)
+    is_relevance_classifier = "relevance" in field_names
+    entry_id = str(uuid5(NAMESPACE_URL, input_text))
+    values = {}
+
+    for name in field_names:
+        if name in ("reasoning", "rationale", "thoughts", "explanation"):
+            values[name] = "Scripted benchmark response."
+        elif name == "relevance":
+            values[name] = "TRUE" if relevant else "FALSE"
+        elif name == "category":
+            values[name] = ("goal" if relevant else "irrelevant") if is_relevance_classifier else "Task"
+        elif name == "content":
+            values[name] = input_text
+        elif name == "status":
+            values[name] = "CreateMemory"
+        elif name == "details":
+            values[name] = json.dumps([{"reason": "benchmark"}])
+        elif name in ("match_entry", "to_remove"):
+            values[name] = "[]"
+        elif name == "modify_knowledge":
+            values[name] = "{}"
+        elif name == "id":
+            values[name] = entry_id
+        elif name == "output":
+            values[name] = json.dumps({
+                "id": entry_id, "category": "Task", "content": input_text, "status": "CreateMemory",
+                "details": [{"reason": "benchmark"}], "original_entry": {},
+            })
+        elif name == "message":
+            values[name] = f"I want to get better at {context or 'something'}."
+        else:
+            values[name] = ""
+    return values
+
+def render_chat_response(values):
+    # the format dspy's ChatAdapter parses.
+    parts = [f"[[ ## {name} ## ]]\n{value}" for name, value in values.items()]
+    return "\n\n".join(parts + ["[[ ## completed ## ]]"])
+
+
+class FakeLM(dspy.LM):
+    """
+    Deterministic, offline stand-in for the Groq LM.
+
+    Requests are answered from a recorded ResponseCache when one is given (replaying real traffic), and
+    otherwise from scripted per-field answers. Each call sleeps `latency` seconds (+/- `jitter`, seeded)
+    to model the provider, and is logged in `history` with estimated prompt/completion token counts.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0, recorded=None):
+        super().__init__("fake/benchmark", cache=False, max_tokens=500)
+        self.latency = latency
+        self.jitter = jitter
+        self.recorded = recorded
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        messages = messages or [{"role": "user", "content": prompt}]
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+        outputs = None
+        if self.recorded is not None:
+            outputs = self.recorded.get(request_key(self.model, prompt, messages, {**self.kwargs, **kwargs}))
+        if outputs is None:
+            outputs = [self._script(messages)]
+
+        time.sleep(delay)
+        prompt_text = "\n".join(message["content"] for message in messages)
+        with self._lock:
+            self.history.append({
+                "messages": messages,
+                "outputs": outputs,
+                "latency_s": delay,
+                "usage": {
+                    "prompt_tokens": estimate_tokens(prompt_text),
+                    "completion_tokens": sum(estimate_tokens(output) for output in outputs),
+                },
+            })
+        return outputs
+
+    def _script(self, messages):
+        system = messages[0]["content"]
+        fields_block = _OUTPUT_FIELDS_RE.search(system)
+        field_names = _FIELD_NAME_RE.findall(fields_block.group(1)) if fields_block else []
+
+        last = messages[-1]["content"]
+        input_text = _INPUT_TEXT_RE.search(last)
+        context = _CONTEXT_RE.search(last)
+        values = scripted_fields(field_names, input_text.group(1).strip() if input_text else "", context.group(1).strip() if context else "")
+        return render_chat_response(values)
+
+    def copy(self, **kwargs):
+        return self
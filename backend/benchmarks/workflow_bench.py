@@ -0,0 +1,156 @@
+"""
+Offline benchmark of the whole LangGraph workflow.
+
+    cd backend && python -m benchmarks.workflow_bench --sizes 10 1000 100000 --messages 20 --latency 0.05
+
+Every LLM call goes to the scripted FakeLM, so the numbers are our own overhead plus the simulated provider
+latency: per-node and end-to-end percentiles, LLM calls and prompt tokens per message, and how all of that
+(plus process memory) moves as the user's memory grows.
+"""
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import resource
+import statistics
+from uuid import UUID
+from contextlib import redirect_stdout, nullcontext
+from types import SimpleNamespace
+
+SAMPLE_MESSAGES = [
+    "I want to learn Python in the next three months",
+    "The weather is nice today.",
+    "I'm saving for a house.",
+    "Just finished watching a movie.",
+    "I need to finish the quarterly report by Friday",
+    "I'm an introvert and prefer quiet environments",
+]
+CATEGORIES = ["ShortTermGoals", "MediumTermGoals", "LongTermGoals", "Task", "JournalEntry", "UserAttribute"]
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def seed_memory(directory, session_id, size):
+    # written straight in the MemoryStore log format, going through put() would fsync 100k times.
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{session_id}.jsonl"), 'w') as f:
+        for i in range(size):
+            entry = {
+                "id": str(UUID(int=i + 1)),
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "content": f"Benchmark memory {i}: practice topic {i % 97} every week",
+                "status": "CreateMemory",
+                "details": [{"reason": f"reason {i % 13}"}],
+                "original_entry": {},
+            }
+            f.write(json.dumps({"op": "put", "id": entry["id"], "entry": entry}) + "\n")
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_size(main_temp, fake, size, messages, sessions_dir, verbose=False):
+    session_id = f"bench{size}"
+    seed_memory(sessions_dir, session_id, size)
+
+    node_times, node_calls = {}, {}
+    end_to_end, calls_per_message, prompt_tokens = [], [], []
+
+    for i in range(messages):
+        text = f"{SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]} #{i}"
+        quiet = nullcontext() if verbose else redirect_stdout(io.StringIO())
+        with quiet, main_temp.sessions.acquire(session_id) as session:
+            started_at = time.perf_counter()
+            history_start = calls_before = len(fake.history)
+            state = main_temp.new_state(session, text)
+            last = time.perf_counter()
+            node_times.setdefault("build_state", []).append(last - started_at)
+
+            for update in main_temp.app.stream(state):
+                now = time.perf_counter()
+                calls_now = len(fake.history)
+                for node in update:
+                    node_times.setdefault(node, []).append(now - last)
+                    node_calls.setdefault(node, []).append(calls_now - calls_before)
+                calls_before = calls_now
+                last = now
+
+            end_to_end.append(time.perf_counter() - started_at)
+
+        message_calls = fake.history[history_start:]
+        calls_per_message.append(len(message_calls))
+        prompt_tokens.extend(call["usage"]["prompt_tokens"] for call in message_calls)
+
+    return {
+        "memory_size": size,
+        "messages": messages,
+        "end_to_end_s": {"p50": percentile(end_to_end, 0.5), "p95": percentile(end_to_end, 0.95), "p99": percentile(end_to_end, 0.99)},
+        "nodes_s": {node: {"p50": percentile(times, 0.5), "p95": percentile(times, 0.95)} for node, times in node_times.items()},
+        "llm_calls_per_message": statistics.mean(calls_per_message),
+        "llm_calls_per_node": {node: statistics.mean(calls) for node, calls in node_calls.items()},
+        "prompt_tokens": {"p50": percentile(prompt_tokens, 0.5), "max": max(prompt_tokens, default=0)},
+        "peak_rss_mb": peak_rss_mb(),
+        "store_bytes": os.path.getsize(os.path.join(sessions_dir, f"{session_id}.jsonl")),
+    }
+
+def print_result(result):
+    e2e = result["end_to_end_s"]
+    print(f"\n== memory size {result['memory_size']} ({result['messages']} messages) ==")
+    print(f"end-to-end p50 {e2e['p50'] * 1000:.1f}ms  p95 {e2e['p95'] * 1000:.1f}ms  p99 {e2e['p99'] * 1000:.1f}ms")
+    for node, times in result["nodes_s"].items():
+        calls = result["llm_calls_per_node"].get(node, 0.0)
+        print(f"  {node:<20} p50 {times['p50'] * 1000:8.1f}ms  p95 {times['p95'] * 1000:8.1f}ms  {calls:.1f} llm calls")
+    print(f"llm calls/message {result['llm_calls_per_message']:.1f}, prompt tokens p50 {result['prompt_tokens']['p50']} max {result['prompt_tokens']['max']}")
+    print(f"peak rss {result['peak_rss_mb']:.0f}MB, store {result['store_bytes'] / 1024:.0f}KB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the LangGraph workflow with a fake LM")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the nodes' own prints")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mentor-bench-")
+    sessions_dir = os.path.join(workdir, "sessions")
+    # main_temp reads these at import time.
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+    os.environ["SESSIONS_DIR"] = sessions_dir
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.sqlite")
+    # background shadow checks would add LLM calls to whichever message happens to be running.
+    os.environ.setdefault("RELEVANCE_ROUTER_SHADOW_RATE", "0")
+    # calibration classifies the held-out set, which the uncompiled benchmark detector doesn't have.
+    os.environ.setdefault("RELEVANCE_ROUTER_CALIBRATE", "0")
+
+    import dspy
+    from benchmarks.fake_lm import FakeLM
+    from llm.core import main_temp
+    from llm.core.registry import registry
+    from llm.core.modules.relevance_module import RelevanceModule
+    from llm.core.modules.knowledge_module import KnowledgeMaster
+
+    fake = FakeLM(latency=args.latency, jitter=args.jitter)
+    # main_temp installs a small/large ModelCascade over the Groq LMs, which would route every stage around the fake.
+    dspy.settings.configure(lm=fake, lm_cascade=None)
+    # uncompiled modules, loading the real ones would compile against the fake LM and overwrite the artifacts.
+    registry.swap("relevance", SimpleNamespace(model=RelevanceModule()))
+    registry.swap("knowledge_master", SimpleNamespace(model=KnowledgeMaster()))
+
+    results = []
+    for size in args.sizes:
+        result = run_size(main_temp, fake, size, args.messages, sessions_dir, verbose=args.verbose)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
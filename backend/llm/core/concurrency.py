@@ -0,0 +1,103 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import dspy
+from llm.core.observability import metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor(max_workers=8):
+    """Shared pool for LLM stages. Modules get deep-copied by dspy, so the pool can't live on them."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-stage")
+    return _executor
+
+def with_current_settings(fn):
+    """
+    dspy.settings.context overrides (trace during compile, lm, ...) are thread-local,
+    so capture the caller's settings and re-enter them inside the worker thread.
+    """
+    config = dict(dspy.settings.config)
+
+    def run(*args, **kwargs):
+        with dspy.settings.context(**config):
+            return fn(*args, **kwargs)
+
+    return run
+
+class StageError(Exception):
+    def __init__(self, errors):
+        self.errors = errors  # stage name -> exception, in declaration order
+        self.stage = next(iter(errors))
+        super().__init__(", ".join(f"{stage} failed: {error!r}" for stage, error in errors.items()))
+
+def run_stages(stages, executor=None):
+    """
+    Run independent stages concurrently and return {name: result} in the order they were declared,
+    no matter which one finishes first. Every stage is awaited before errors are raised, so a failing
+    stage never leaves another one running in the background.
+    """
+    executor = executor or get_executor()
+    futures = {name: executor.submit(with_current_settings(stage)) for name, stage in stages.items()}
+
+    results, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+
+    if errors:
+        raise StageError(errors)
+    return results
+
+
+class Speculation:
+    """
+    Work started before we know whether it will be needed. take() waits for it and records how much latency it
+    saved; discard() cancels it if it hasn't started yet, otherwise the finished or in-flight call is counted as waste.
+    """
+
+    def __init__(self, name, fn, executor=None):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.running_at = None
+        self.finished_at = None
+        self._future = (executor or get_executor()).submit(with_current_settings(self._run), fn)
+
+    def _run(self, fn):
+        self.running_at = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def take(self):
+        needed_at = time.perf_counter()
+        try:
+            result = self._future.result()
+        except Exception as e:
+            metrics.inc("mentor_speculation_total", help="Speculative calls by outcome", name=self.name, outcome="failed")
+            print(f"Speculative {self.name} failed, running it inline: {e!r}")
+            return None
+        # without speculation the call would have started now and taken as long as it did.
+        duration = self.finished_at - self.running_at
+        waited = max(0.0, self.finished_at - needed_at)
+        metrics.inc("mentor_speculation_total", help="Speculative calls by outcome", name=self.name, outcome="used")
+        metrics.observe("mentor_speculation_saved_seconds", duration - waited, help="Latency saved by speculative calls that were used", name=self.name)
+        return result
+
+    def discard(self):
+        if self._future.cancel():
+            metrics.inc("mentor_speculation_total", help="Speculative calls by outcome", name=self.name, outcome="cancelled")
+            return
+        # already running: it will finish in the background and its result is dropped.
+        metrics.inc("mentor_speculation_total", help="Speculative calls by outcome", name=self.name, outcome="wasted")
+        self._future.add_done_callback(lambda _: metrics.observe(
+            "mentor_speculation_wasted_seconds", self.finished_at - self.running_at,
+            help="LLM time spent on speculative calls whose result was dropped", name=self.name,
+        ))
@@ -0,0 +1,180 @@
+import time
+import threading
+from collections import deque
+from uuid import uuid4
+from llm.core.memory.store import MemoryStore
+from llm.core.observability import metrics
+
+class KnowledgeQueue:
+    """
+    Durable write-behind queue for knowledge processing (KnowledgeMaster + memory ops), so a turn can answer
+    right after relevance and leave the multi-call chain to the background.
+
+    Jobs are persisted in a MemoryStore log (fsynced put on enqueue, delete once processed), so a restart picks
+    pending jobs up again in order. Jobs of one session run strictly one after another in enqueue order, different
+    sessions run in parallel on `workers` threads. A failing job is retried with exponential backoff without
+    holding a worker; after `max_retries` it is parked as dead so the user's later jobs aren't stuck behind it.
+    Delivery is at least once: a retried or recovered job runs with replay=True and process() has to skip work
+    it already applied.
+    wait_for(session_id) is the read-your-writes barrier for memory reads.
+    """
+
+    def __init__(self, filepath, process, workers=2, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.process = process  # process(session_id, input_text, job_id=..., replay=...)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.store = MemoryStore(filepath)
+
+        self._cond = threading.Condition()
+        self._pending = {}  # session_id -> deque of jobs, head is the one running or next to run
+        self._ready = deque()  # sessions whose head job can run now
+        self._scheduled = set()  # sessions in _ready, running, or waiting on a retry timer
+        self._seq = 0
+        self._threads = []
+        self._stopped = False
+        self._recover()
+
+    # --- producer side ---
+
+    def enqueue(self, session_id, input_text):
+        with self._cond:
+            self._seq += 1
+            job = {"id": str(uuid4()), "session_id": session_id, "input_text": input_text, "seq": self._seq,
+                   "enqueued_at": time.time(), "attempts": 0, "status": "pending"}
+            # durable before we tell anyone it is queued.
+            self.store.put(job)
+            self._pending.setdefault(session_id, deque()).append(job)
+            self._schedule(session_id)
+            metrics.inc("mentor_knowledge_jobs_total", help="Write-behind knowledge jobs by outcome", outcome="enqueued")
+            return job["id"]
+
+    def wait_for(self, session_id, timeout=30.0):
+        """Block until every job of the session enqueued so far has been processed. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending.get(session_id):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def pending(self, session_id=None):
+        with self._cond:
+            if session_id is not None:
+                return len(self._pending.get(session_id, ()))
+            return sum(len(jobs) for jobs in self._pending.values())
+
+    def stats(self):
+        with self._cond:
+            heads = [jobs[0]["enqueued_at"] for jobs in self._pending.values() if jobs]
+            depth = sum(len(jobs) for jobs in self._pending.values())
+        return {"depth": depth, "lag_s": time.time() - min(heads) if heads else 0.0, "sessions": len(heads)}
+
+    # --- workers ---
+
+    def start(self):
+        metrics.add_collector(self._export_gauges)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"knowledge-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.store.close()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                session_id = self._ready.popleft()
+                job = self._pending[session_id][0]
+
+            started = time.perf_counter()
+            try:
+                # replay: the job may have been applied before a crash or failure, process has to check.
+                self.process(job["session_id"], job["input_text"], job_id=job["id"], replay=job["attempts"] > 0 or job.get("recovered", False))
+            except Exception as e:
+                self._failed(session_id, job, e)
+                continue
+            metrics.observe("mentor_knowledge_job_seconds", time.perf_counter() - started, help="Processing time of a knowledge job")
+            metrics.observe("mentor_knowledge_job_lag_seconds", time.time() - job["enqueued_at"], help="Enqueue to done time of a knowledge job",
+                            buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+            metrics.inc("mentor_knowledge_jobs_total", help="Write-behind knowledge jobs by outcome", outcome="done")
+            self._finish(session_id, job)
+
+    def _finish(self, session_id, job):
+        with self._cond:
+            self.store.delete(job["id"])
+            self._advance(session_id)
+
+    def _failed(self, session_id, job, error):
+        job["attempts"] += 1
+        if job["attempts"] > self.max_retries:
+            print(f"Knowledge job {job['id']} for session {session_id} failed {job['attempts']} times, giving up: {error!r}")
+            metrics.inc("mentor_knowledge_jobs_total", help="Write-behind knowledge jobs by outcome", outcome="dead")
+            with self._cond:
+                # kept in the log for inspection, skipped on recovery.
+                self.store.update(job["id"], {"status": "dead", "attempts": job["attempts"], "error": repr(error)})
+                self._advance(session_id)
+            return
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (job["attempts"] - 1))
+        print(f"Knowledge job {job['id']} failed ({error!r}), retry {job['attempts']}/{self.max_retries} in {delay:.0f}s")
+        metrics.inc("mentor_knowledge_jobs_total", help="Write-behind knowledge jobs by outcome", outcome="retried")
+        self.store.update(job["id"], {"attempts": job["attempts"]})
+        # the session stays scheduled, so none of its later jobs can overtake this one.
+        timer = threading.Timer(delay, self._requeue, args=(session_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, session_id):
+        with self._cond:
+            self._ready.append(session_id)
+            # notify_all: readers in wait_for share the condition, a single notify could wake one of them instead of a worker.
+            self._cond.notify_all()
+
+    def _advance(self, session_id):
+        # caller holds the condition.
+        jobs = self._pending[session_id]
+        jobs.popleft()
+        self._scheduled.discard(session_id)
+        if jobs:
+            self._schedule(session_id)
+        else:
+            del self._pending[session_id]
+        self._cond.notify_all()
+
+    def _schedule(self, session_id):
+        if session_id not in self._scheduled:
+            self._scheduled.add(session_id)
+            self._ready.append(session_id)
+            self._cond.notify_all()
+
+    def _recover(self):
+        stored = self.store.all()
+        jobs = sorted((job for job in stored if job.get("status") != "dead"), key=lambda job: job["seq"])
+        for job in jobs:
+            job["recovered"] = True
+            self._pending.setdefault(job["session_id"], deque()).append(job)
+        self._seq = max((job["seq"] for job in stored), default=0)
+        with self._cond:
+            for session_id in self._pending:
+                self._schedule(session_id)
+        if jobs:
+            print(f"Recovered {len(jobs)} pending knowledge jobs")
+
+    def _export_gauges(self):
+        stats = self.stats()
+        metrics.set("mentor_knowledge_queue_depth", stats["depth"], help="Knowledge jobs waiting or running")
+        metrics.set("mentor_knowledge_queue_lag_seconds", stats["lag_s"], help="Age of the oldest pending knowledge job")
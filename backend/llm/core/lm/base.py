@@ -0,0 +1,40 @@
+import copy
+import dspy
+
+class WrappedLM(dspy.LM):
+    """
+    Base for layers that sit between the dspy predictors and the real LM (cache, tracing, ...).
+    It subclasses dspy.LM so Predict keeps using the chat adapter path, but it doesn't call
+    dspy.LM.__init__: everything it doesn't override (history, inspect_history, ...) is read
+    from the wrapped LM, so layers can be stacked in any order.
+    """
+
+    def __init__(self, lm):
+        self.lm = lm
+        self.model = lm.model
+        self.model_type = lm.model_type
+        self.kwargs = lm.kwargs
+        self.cache = getattr(lm, "cache", False)
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        return self.lm(prompt=prompt, messages=messages, **kwargs)
+
+    def __getattr__(self, name):
+        # only called for attributes we don't have; guard "lm" so copy/pickle can't recurse.
+        if name == "lm":
+            raise AttributeError(name)
+        return getattr(self.lm, name)
+
+    @property
+    def base_lm(self):
+        lm = self.lm
+        while isinstance(lm, WrappedLM):
+            lm = lm.lm
+        return lm
+
+    def copy(self, **kwargs):
+        # shallow on purpose: the copy shares this layer's state (cache db, counters, ...).
+        clone = copy.copy(self)
+        clone.lm = self.lm.copy(**kwargs)
+        clone.kwargs = clone.lm.kwargs
+        return clone
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import dspy
+from llm.core.lm.base import WrappedLM
+
+# whether the last CachedLM call on this thread was served from the cache, read by the tracing layer above it.
+_last_call = threading.local()
+
+def last_call_was_cached():
+    return getattr(_last_call, "cached", False)
+
+def last_call_was_coalesced():
+    # set by CoalescingLM: the call joined one already in flight and never reached the provider itself.
+    return getattr(_last_call, "coalesced", False)
+
+def cache_bypass():
+    """`with cache_bypass():` skips the response cache for every LM call made inside (training, retraining)."""
+    return dspy.settings.context(bypass_llm_cache=True)
+
+def request_key(model, prompt, messages, kwargs):
+    """
+    Content address of one LM request. The rendered messages already carry the signature instructions,
+    the demos and the inputs, so hashing them together with the model and the sampling kwargs covers
+    (model, signature, demos, inputs) without having to know which predictor made the call.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "messages": messages,
+        "kwargs": {k: v for k, v in sorted(kwargs.items()) if k not in ("api_key", "api_base")},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite backed response store with TTL expiry and LRU eviction once it grows past max_entries."""
+
+    def __init__(self, filepath="local_cache/llm_responses.sqlite", max_entries=50_000, ttl=7 * 24 * 3600):
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._writes += 1
+            # counting rows on every write is wasteful, checking every 100 writes is plenty.
+            if self._writes % 100 == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+class CachedLM(WrappedLM):
+    """Serves repeated requests from a ResponseCache instead of calling the provider again."""
+
+    def __init__(self, lm, cache, bypass=False):
+        super().__init__(lm)
+        self.response_cache = cache
+        self.bypass = bypass
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        _last_call.cached = False
+        if self.bypass or dspy.settings.config.get("bypass_llm_cache", False):
+            return self.lm(prompt=prompt, messages=messages, **kwargs)
+
+        key = request_key(self.model, prompt, messages, {**self.kwargs, **kwargs})
+        outputs = self.response_cache.get(key)
+        _last_call.cached = outputs is not None
+        if outputs is None:
+            outputs = self.lm(prompt=prompt, messages=messages, **kwargs)
+            self.response_cache.set(key, outputs)
+        return outputs
@@ -0,0 +1,96 @@
+import json
+import dspy
+from llm.core.observability import metrics
+
+# stage -> "small" / "large" (always that model) or "cascade" (small first, large when the output doesn't hold up).
+# Stages left out use whatever LM is configured globally.
+DEFAULT_ASSIGNMENT = {
+    "relevance": "cascade",
+    "analyze": "cascade",
+    "extract_details": "cascade",
+    "check_original": "large",
+    "merge": "large",
+    "finalize": "large",
+}
+
+def load_assignment(overrides=None):
+    """DEFAULT_ASSIGNMENT updated with a JSON object (LM_ASSIGNMENT env var), e.g. '{"merge": "cascade"}'."""
+    assignment = dict(DEFAULT_ASSIGNMENT)
+    if overrides:
+        assignment.update(json.loads(overrides) if isinstance(overrides, str) else overrides)
+    return assignment
+
+
+class ModelCascade:
+    """
+    Per-stage LM assignment plus a cheap-first cascade.
+
+    A cascaded stage runs on each tier in `order` until one produces an output its validator accepts; an exception
+    counts as a rejection. The last tier's answer is returned even if it doesn't validate (there is nothing left to
+    escalate to, counted as "unvalidated"), and its exception propagates. Outcomes per stage and tier go to
+    mentor_cascade_total, so the small model's hit rate per stage is accepted{tier=small} / all{tier=small}.
+    """
+
+    def __init__(self, lms, assignment=None, order=("small", "large")):
+        self.lms = lms  # tier name -> LM
+        self.assignment = assignment if assignment is not None else dict(DEFAULT_ASSIGNMENT)
+        self.order = [tier for tier in order if tier in lms]
+
+    def run(self, stage, call, validate=None):
+        spec = self.assignment.get(stage)
+        if spec is None:
+            return call()
+        if spec != "cascade":
+            with dspy.settings.context(lm=self.lms[spec]):
+                return call()
+
+        trace = dspy.settings.config.get("trace")
+        for i, tier in enumerate(self.order):
+            last = i == len(self.order) - 1
+            # where this attempt's predictor calls start in the trace, so a rejected one can be taken out again.
+            mark = len(trace) if trace is not None else None
+            try:
+                with dspy.settings.context(lm=self.lms[tier]):
+                    result = call()
+            except Exception as e:
+                self._count(stage, tier, "error")
+                if last:
+                    raise
+                print(f"{stage} failed on the {tier} model, escalating: {e!r}")
+                continue
+
+            valid = validate is None or self._valid(validate, result)
+            if valid or last:
+                self._count(stage, tier, "accepted" if valid else "unvalidated")
+                return result
+            self._count(stage, tier, "rejected")
+            # compile records the trace as demos, an output that failed validation must not become one.
+            self._drop_trace(trace, mark, result)
+
+    def _drop_trace(self, trace, mark, result):
+        # by identity, not by slicing: stages running side by side (run_stages) append to the same trace list.
+        if trace is None:
+            return
+        for i in range(len(trace) - 1, mark - 1, -1):
+            if trace[i][2] is result:
+                del trace[i]
+
+    def _valid(self, validate, result):
+        try:
+            return bool(validate(result))
+        except Exception:
+            return False
+
+    def _count(self, stage, tier, outcome):
+        metrics.inc("mentor_cascade_total", help="Cascaded LM stage attempts by tier and outcome", stage=stage, tier=tier, outcome=outcome)
+
+
+def run_stage(stage, call, validate=None):
+    """
+    Run one predictor call through the configured ModelCascade (dspy.settings lm_cascade), or directly if there is none.
+    Training (retrain, evaluate, synthetic data) bypasses the cascade: demos and held-out scores come from the large model.
+    """
+    cascade = dspy.settings.config.get("lm_cascade")
+    if cascade is None or dspy.settings.config.get("lm_lane") == "training":
+        return call()
+    return cascade.run(stage, call, validate)
@@ -0,0 +1,90 @@
+import threading
+import dspy
+from llm.core.lm.base import WrappedLM
+from llm.core.lm.cache import request_key, _last_call
+from llm.core.observability import metrics
+
+
+class _Flight:
+    __slots__ = ("done", "outputs", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+        self.followers = 0
+
+
+class CoalescingLM(WrappedLM):
+    """
+    Single-flight for identical LM requests: while one is in flight, the same (model, messages, kwargs) from other
+    threads waits for it instead of sending its own, and everyone gets the same outputs (or the same error).
+
+    Sits under CachedLM, which only helps once the first answer is stored; this covers the concurrent misses
+    before that (a compile or eval batch hitting the same demo, many sessions sending the same small talk).
+
+    Calls that want their own sample (cache bypass, temperature > 0, n > 1) always go out on their own, and
+    flights are per scheduler lane, so a user turn never waits behind a training call the scheduler is holding.
+    """
+
+    def __init__(self, lm):
+        super().__init__(lm)
+        self._lock = threading.Lock()
+        self._flights = {}  # (lane, request key) -> _Flight
+        self.counts = {"leader": 0, "follower": 0}
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        _last_call.coalesced = False
+        merged = {**self.kwargs, **kwargs}
+        if not self._coalescable(merged):
+            metrics.inc("mentor_llm_coalesce_total", help="LM requests that went out (leader) or joined one in flight (follower)", role="skipped")
+            return self.lm(prompt=prompt, messages=messages, **kwargs)
+
+        key = (dspy.settings.config.get("lm_lane") or "interactive", request_key(self.model, prompt, messages, merged))
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+            self.counts["leader" if leader else "follower"] += 1
+        metrics.inc("mentor_llm_coalesce_total", help="LM requests that went out (leader) or joined one in flight (follower)", role="leader" if leader else "follower")
+
+        if not leader:
+            _last_call.coalesced = True
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # every waiter gets its own list, dspy may append to it.
+            return list(flight.outputs)
+
+        try:
+            flight.outputs = self.lm(prompt=prompt, messages=messages, **kwargs)
+            return flight.outputs
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            # out of the table before waking anyone, a request arriving now starts a fresh flight.
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            if flight.followers:
+                metrics.observe("mentor_llm_coalesce_fanout", flight.followers, help="Followers served by one coalesced LM request",
+                                buckets=(1, 2, 4, 8, 16, 32))
+
+    def _coalescable(self, kwargs):
+        if dspy.settings.config.get("bypass_llm_cache", False):
+            return False
+        return (kwargs.get("temperature") or 0) <= 0 and (kwargs.get("n") or 1) <= 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = counts["leader"] + counts["follower"]
+        # share of requests that never reached the provider.
+        return {**counts, "coalescing_ratio": counts["follower"] / total if total else 0.0}
+
+    def export_gauges(self):
+        metrics.set("mentor_llm_coalescing_ratio", self.stats()["coalescing_ratio"], help="Share of LM requests served by a request already in flight", model=self.model)
@@ -0,0 +1,58 @@
+import time
+import random
+import threading
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate_per_minute`, holding at most `capacity` tokens."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, amount=1):
+        """Take `amount` tokens if available, otherwise return how many seconds until they would be."""
+        with self._lock:
+            self._refill()
+            # a request bigger than the bucket could never run, let it through once the bucket is full.
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount=1):
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+    def refund(self, amount=1):
+        """Give back tokens taken by try_acquire for a call that didn't go out after all."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def is_rate_limit_error(error):
+    text = str(error).lower()
+    return "ratelimit" in type(error).__name__.lower() or "429" in text or "rate limit" in text
+
+def call_with_backoff(fn, max_retries=5, base_delay=1.0, max_delay=30.0):
+    """Retry `fn` on rate limit errors with exponential backoff and jitter, anything else is raised right away."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limit_error(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
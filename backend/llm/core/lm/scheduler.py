@@ -0,0 +1,206 @@
+import time
+import heapq
+import threading
+from collections import deque
+import dspy
+from llm.core.lm.base import WrappedLM
+from llm.core.lm.rate_limit import TokenBucket
+from llm.core.observability import metrics, estimate_tokens
+
+# highest priority first. A lane only gets a free slot when every lane above it has nothing waiting.
+LANES = ("interactive", "background", "training")
+
+def lm_lane(lane, user=None):
+    """Run the LM calls inside this block in `lane` (and on behalf of `user`), e.g. `with lm_lane("training"):`."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown LM lane: {lane}")
+    overrides = {"lm_lane": lane}
+    if user is not None:
+        overrides["lm_user"] = user
+    return dspy.settings.context(**overrides)
+
+
+class _Ticket:
+    __slots__ = ("lane", "user", "cost", "start", "finish", "seq", "queued_at")
+
+    def __init__(self, lane, user, cost, start, finish, seq):
+        self.lane = lane
+        self.user = user
+        self.cost = cost
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class LMScheduler:
+    """
+    One admission point for every LM call in the process, so a retrain can't eat the rate limit users need.
+
+    - calls queue in a lane (interactive > background > training) and free slots go to the highest lane waiting.
+    - inside a lane users are served by weighted fair queuing on estimated tokens, so one chatty session or
+      one big eval batch doesn't push everyone else back.
+    - at most `max_concurrency` calls are in flight, and at most `rpm` calls and `tpm` estimated tokens go out
+      per minute across lanes (the provider's per-model limits, so nothing else needs its own limiter).
+    - training is held back (queued calls wait, running ones finish) while the p95 of interactive calls over the
+      last `window` seconds is above `preempt_p95`, and released again once it drops below 80% of that.
+    """
+
+    def __init__(self, max_concurrency=8, tpm=None, lane_limits=None, user_weights=None, preempt_p95=None, window=60.0, rpm=None):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        # training never takes more than half the slots, so a burst of users doesn't wait on a full pool.
+        self.lane_limits = lane_limits if lane_limits is not None else {"training": max(1, max_concurrency // 2)}
+        self.user_weights = user_weights or {}
+        self.preempt_p95 = preempt_p95
+        self.window = window
+
+        self._cond = threading.Condition()
+        self._queues = {lane: [] for lane in LANES}  # heap of tickets by virtual finish tag
+        self._in_flight = {lane: 0 for lane in LANES}
+        self._virtual = {lane: 0.0 for lane in LANES}  # virtual time of each lane, start tag of the last dispatch
+        self._user_finish = {}  # (lane, user) -> finish tag of that user's last ticket
+        self._latencies = deque()  # (finished at, wait + service) of recent interactive calls
+        self._seq = 0
+        self.training_paused = False
+
+    def acquire(self, lane, user, cost):
+        with self._cond:
+            self._seq += 1
+            weight = self.user_weights.get(user, 1.0)
+            start = max(self._virtual[lane], self._user_finish.get((lane, user), 0.0))
+            ticket = _Ticket(lane, user, cost, start, start + cost / weight, self._seq)
+            self._user_finish[(lane, user)] = ticket.finish
+            heapq.heappush(self._queues[lane], ticket)
+            # a new head (or a higher lane) may change who should go next.
+            self._cond.notify_all()
+
+            while True:
+                wait = 1.0  # re-check now and then, the interactive window can age out while nothing finishes.
+                if self._head() is ticket:
+                    wait = self._try_budgets(cost)
+                    if wait == 0.0:
+                        break
+                self._cond.wait(wait)
+
+            heapq.heappop(self._queues[lane])
+            self._virtual[lane] = ticket.start
+            self._in_flight[lane] += 1
+            if len(self._user_finish) > 4096:
+                # users whose last finish tag the lane has passed get no credit from it anymore.
+                self._user_finish = {key: finish for key, finish in self._user_finish.items() if finish > self._virtual[key[0]]}
+            self._cond.notify_all()
+
+        metrics.observe("mentor_scheduler_wait_seconds", time.monotonic() - ticket.queued_at, help="Time LM calls spent queued in the scheduler", lane=lane)
+        return ticket
+
+    def _try_budgets(self, cost):
+        # both or neither: a request slot taken while the token budget is short is given back.
+        wait = self.requests.try_acquire(1) if self.requests else 0.0
+        if wait == 0.0 and self.tokens:
+            wait = self.tokens.try_acquire(cost)
+            if wait and self.requests:
+                self.requests.refund(1)
+        return wait
+
+    def release(self, ticket, service_seconds, error=False):
+        with self._cond:
+            self._in_flight[ticket.lane] -= 1
+            if ticket.lane == "interactive":
+                now = time.monotonic()
+                self._latencies.append((now, now - ticket.queued_at))
+            self._update_preemption()
+            self._cond.notify_all()
+
+        metrics.observe("mentor_scheduler_service_seconds", service_seconds, help="Time LM calls spent running after leaving the scheduler", lane=ticket.lane)
+        metrics.inc("mentor_scheduler_calls_total", help="LM calls through the scheduler by lane and outcome", lane=ticket.lane, outcome="error" if error else "ok")
+
+    def _head(self):
+        # caller holds the condition.
+        if sum(self._in_flight.values()) >= self.max_concurrency:
+            return None
+        self._update_preemption()
+        for lane in LANES:
+            queue = self._queues[lane]
+            if not queue:
+                continue
+            if lane == "training" and self.training_paused:
+                continue
+            limit = self.lane_limits.get(lane)
+            if limit is not None and self._in_flight[lane] >= limit:
+                continue
+            return queue[0]
+        return None
+
+    def _update_preemption(self):
+        # caller holds the condition.
+        if self.preempt_p95 is None:
+            return
+        cutoff = time.monotonic() - self.window
+        while self._latencies and self._latencies[0][0] < cutoff:
+            self._latencies.popleft()
+        p95 = self._p95()
+        if not self.training_paused and p95 > self.preempt_p95:
+            print(f"Interactive p95 {p95:.2f}s is above {self.preempt_p95:.2f}s, holding training LM calls back.")
+            self.training_paused = True
+            metrics.inc("mentor_scheduler_preemptions_total", help="Times training was held back for interactive latency")
+        elif self.training_paused and p95 < 0.8 * self.preempt_p95:
+            print("Interactive latency recovered, resuming training LM calls.")
+            self.training_paused = False
+
+    def _p95(self):
+        if not self._latencies:
+            return 0.0
+        latencies = sorted(latency for _, latency in self._latencies)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def stats(self):
+        with self._cond:
+            self._update_preemption()
+            return {
+                "queued": {lane: len(queue) for lane, queue in self._queues.items()},
+                "in_flight": dict(self._in_flight),
+                "training_paused": self.training_paused,
+                "interactive_p95_s": self._p95(),
+            }
+
+    def export_gauges(self):
+        stats = self.stats()
+        for lane in LANES:
+            metrics.set("mentor_scheduler_queue_depth", stats["queued"][lane], help="LM calls waiting in the scheduler", lane=lane)
+            metrics.set("mentor_scheduler_in_flight", stats["in_flight"][lane], help="LM calls running", lane=lane)
+        metrics.set("mentor_scheduler_training_paused", int(stats["training_paused"]), help="1 while training LM calls are held back")
+        metrics.set("mentor_scheduler_interactive_p95_seconds", stats["interactive_p95_s"], help="p95 of interactive LM calls (queue + service) over the window")
+
+
+class ScheduledLM(WrappedLM):
+    """
+    Sends every call through an LMScheduler. The lane and user come from dspy settings (lm_lane / lm_user,
+    see lm_lane()), calls without one are interactive. Sits under CachedLM, so cache hits never queue.
+    """
+
+    def __init__(self, lm, scheduler):
+        super().__init__(lm)
+        self.scheduler = scheduler
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        lane = dspy.settings.config.get("lm_lane") or "interactive"
+        user = dspy.settings.config.get("lm_user") or "anonymous"
+        prompt_text = "\n".join(message["content"] for message in messages) if messages else (prompt or "")
+        # the provider counts max_tokens against the budget until the answer is in, so do we.
+        cost = estimate_tokens(prompt_text) + kwargs.get("max_tokens", self.kwargs.get("max_tokens", 0))
+
+        ticket = self.scheduler.acquire(lane, user, cost)
+        start = time.perf_counter()
+        error = False
+        try:
+            return self.lm(prompt=prompt, messages=messages, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.scheduler.release(ticket, time.perf_counter() - start, error)
@@ -1,35 +1,88 @@
 import os
+import logging
+import operator
 from pprint import pprint
 import litellm
 import dspy
-from llm.core.trainer.trainer_relevance_input import RelevanceDetector
-from llm.core.trainer.trainer_knowledge_master import KnowledgeMasterTrainer
-from llm.core.modules.relevance_module import RelevanceModule
-from llm.core.modules.knowledge_module import KnowledgeMaster
+from llm.core.registry import registry
+from llm.core.sessions import SessionManager, DEFAULT_SESSION
+from llm.core.lm.cache import CachedLM, ResponseCache
+from llm.core.lm.cascade import ModelCascade, load_assignment
+from llm.core.lm.scheduler import LMScheduler, ScheduledLM, lm_lane
+from llm.core.lm.coalesce import CoalescingLM
+from llm.core.observability import InstrumentedLM, traced_node, metrics
 from llm.core.signatures.knowledge_signature import KnowledgeMasterOutput, StatusEntry
-from typing import List, Dict
+from llm.core.memory.ops import plan_memory_ops
+from llm.core.concurrency import Speculation
+from llm.core.knowledge_queue import KnowledgeQueue
+from typing import Annotated, Any, List, Dict
 from langgraph.graph import StateGraph, END, START
 
 #litellm.drop_params = True
 GROQ_API_KEY = os.environ['GROQ_API_KEY']
-groq = dspy.LM('groq/llama3-70b-8192', api_key=GROQ_API_KEY, max_tokens=500)
-dspy.settings.configure(lm=groq)
+# dspy's own cache is off, CachedLM below is the one cache shared by every predictor and trainer.
+groq = dspy.LM('groq/llama3-70b-8192', api_key=GROQ_API_KEY, max_tokens=500, cache=False)
+# cheap first try for the stages that usually don't need the 70b (see LM_ASSIGNMENT / lm/cascade.py).
+small = dspy.LM(os.environ.get("SMALL_MODEL", "groq/llama3-8b-8192"), api_key=GROQ_API_KEY, max_tokens=500, cache=False)
+llm_cache = ResponseCache(os.environ.get("LLM_CACHE_PATH", "local_cache/llm_responses.sqlite"))
+# every call that misses the cache queues here: users first, then write-behind/shadow work, then training.
+scheduler = LMScheduler(
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 8)),
+    rpm=int(os.environ["GROQ_RPM"]) if os.environ.get("GROQ_RPM") else None,
+    tpm=int(os.environ["GROQ_TPM"]) if os.environ.get("GROQ_TPM") else None,
+    preempt_p95=float(os.environ.get("SCHEDULER_PREEMPT_P95", 5.0)),
+)
+metrics.add_collector(scheduler.export_gauges)
+# identical requests already in flight (a cache miss nobody has stored yet) share one provider call.
+lms = {
+    "large": InstrumentedLM(CachedLM(CoalescingLM(ScheduledLM(groq, scheduler)), llm_cache)),
+    "small": InstrumentedLM(CachedLM(CoalescingLM(ScheduledLM(small, scheduler)), llm_cache)),
+}
+for lm in lms.values():
+    metrics.add_collector(lm.lm.lm.export_gauges)
+cascade = ModelCascade(lms, load_assignment(os.environ.get("LM_ASSIGNMENT")))
+dspy.settings.configure(lm=lms["large"], lm_cascade=cascade)
+sessions = SessionManager(os.environ.get("SESSIONS_DIR", "sessions"))
+logger = logging.getLogger(__name__)
+# answer right after relevance and leave KnowledgeMaster + memory ops to the background knowledge queue.
+KNOWLEDGE_WRITE_BEHIND = os.environ.get("KNOWLEDGE_WRITE_BEHIND", "0") == "1"
+# start KnowledgeMaster.analyze next to the relevance classifier, most traffic is relevant anyway.
+# (write-behind already takes the whole chain off the response path.)
+SPECULATIVE_ANALYZE = os.environ.get("SPECULATIVE_ANALYZE", "0") == "1" and not KNOWLEDGE_WRITE_BEHIND
 
 class State(Dict):
+    session_id: str
     messages: List[str]
-    memory: List[Dict[str, str]]
+    memory: List[Dict[str, str]]  # optional snapshot (write-behind jobs), otherwise knowledge_master reads the store itself
+    memory_ops: Annotated[List[Dict[str, Any]], operator.add]  # what this turn changed
     analyzer_response: any
     relevance: str
     input_text: str
     knowledge_master_response: KnowledgeMasterOutput
+    knowledge_job: str  # write-behind mode: id of the queued knowledge job
 
+@traced_node("input_analyzer")
 def input_analyzer_node(state: State):
     input_text = state['input_text']
     messages = state["messages"] + [f"User: {input_text}"]
     input_text = state.get('input_text', '')
-    detector = RelevanceDetector(RelevanceModule)
-    result = detector.model(dspy.Example(input_text=input_text).with_inputs('input_text'))
-    messages = state["messages"].append(f"User: {input_text}")
+    session = sessions.get(state["session_id"])
+    if session.speculation is not None:
+        # left over from a turn that failed half way.
+        session.speculation.discard()
+        session.speculation = None
+    km_model = registry.get("knowledge_master").model if SPECULATIVE_ANALYZE else None
+    if km_model is not None and km_model.mode == "staged":
+        session.speculation = Speculation("knowledge_master.analyze", lambda: km_model.analyze_input(input_text))
+
+    detector = registry.get("relevance")
+    # confident cases are answered by the local router, only the uncertain ones cost an LLM call.
+    classify = lambda text: detector.model(dspy.Example(input_text=text).with_inputs('input_text'))
+    result = registry.get("relevance_router").route(input_text, classify)
+    if session.speculation is not None and "TRUE" not in result.relevance:
+        # routed to response_generator, nobody will read the analysis.
+        session.speculation.discard()
+        session.speculation = None
     return {"analyzer_response":  {
             "relevance": "TRUE" in result.relevance and "yes" or "no",
             "explanation": result.explanation,
@@ -37,93 +90,87 @@ def input_analyzer_node(state: State):
             "category": result.category
         }, "input_text": input_text, "messages": messages, "relevance": "TRUE" in result.relevance and "yes" or "no"}
 
+@traced_node("knowledge_master")
 def knowledge_master_node(state: State):
     input_text = state["input_text"]
-    existing_knowledge = state['memory']
-    detector = KnowledgeMasterTrainer(KnowledgeMaster)
-
-    km_result = detector.model(input_text=input_text, existing_knowledge=existing_knowledge)
+    detector = registry.get("knowledge_master")
+    session = sessions.get(state["session_id"])
+    # loaded here and not in new_state, turns that aren't relevant never touch the memory.
+    existing_knowledge = state.get("memory")
+    if existing_knowledge is None:
+        existing_knowledge = session.memory.entries()
+    speculation, session.speculation = session.speculation, None
+    analyzed_input = speculation.take() if speculation is not None else None
+
+    km_result = detector.model(input_text=input_text, existing_knowledge=existing_knowledge, analyzed_input=analyzed_input)
     return {"knowledge_master_response": km_result}
 
+@traced_node("knowledge_modifier")
 def knowledge_modifier_node(state: State):
 
     output = state["knowledge_master_response"]["output"]
     context = state["knowledge_master_response"]["context"]
-    print("output:")
-    print(f"\n\n{output}\n\n")
-    print("context:")
-    print(f"\n\n{context}\n\n")
-    memory= state["memory"]
-
-    if StatusEntry(output.status) == StatusEntry("CreateMemory"):
-        # new memory
-        print(f"\n\n\n NEW MEMORY \n\n")
-        new_memory = {
-            "id": str(output.id),
-            "content": output.content,
-            "category": output.category,
-            "status": StatusEntry("CreateMemory"),
-            "details": [],
-            "original_entry": {}
-        }
-
-        new_memory["details"] = output.details
-
-        state["memory"].append(new_memory)
-
-    elif StatusEntry(output.status) == StatusEntry("UpdateMemory"):
-        print(f"\n\n\n UPDATING MEMORY \n\n")
-        original_entry = context["ex_knowledge"][0] # for now we do this.
-        original_id = original_entry["id"]
-        for mem in memory:
-            if mem["id"] == original_id:
-                mem["status"] = StatusEntry("UpdateMemory")
-                # maybe change this later
-                mem["content"] = output.content
-                mem["category"] = output.category
-                mem["details"] = []
-                for detail in output.details:
-                    mem["details"].append(detail)
-
-    elif StatusEntry(output.status) == StatusEntry("DeleteMemory"):
-        # check if we want to delete only details from a memory
-        original_entry = context["ex_knowledge"][0] # for now we do this.
-        print(f"\n DELETING MEMORY ID: {original_entry["id"]} \n")
-        pprint(state["memory"])
-        for i in state['memory']:
-            if i['id'] == original_entry["id"]:
-                print("\nMemory to be deleted:")
-                pprint(i)
-
-        updated_memory = [item for item in state["memory"] if item["id"] != original_entry["id"]]
-        pprint(updated_memory)
-        memory = updated_memory
-
-    elif StatusEntry(output.status) == StatusEntry("DeleteMemoryDetail"):
-        print(f"\n DELETING DETAILS OF MEMORY ID: {output.original_entry.id} \n")
-        pprint(output)
-    else:
-        print(f"\n OTHER STATUS OF MEMORY ID: {output.original_entry.id} \n")
-
-    state["memory"] = memory
-
-
-    return state
-
+    session = sessions.get(state["session_id"])
+    logger.debug("knowledge master output: %s", output)
+    logger.debug("knowledge master context: %s", context)
+
+    # only the change travels through the graph, the store applies it in place.
+    # write-behind: a new memory takes the job id, so a replayed job rewrites it instead of adding a duplicate.
+    job_id = state.get("knowledge_job")
+    ops = plan_memory_ops(output, context, create_id=job_id)
+    if not ops:
+        logger.warning("Nothing to apply for status %s", output.status)
+    audit_context = {"job_id": job_id} if job_id else {}
+    applied = session.apply_ops(ops, input_text=state["input_text"], **audit_context)
+    for op in applied:
+        logger.info("Applied %s on memory %s", op.op, op.id)
+
+    return {"memory_ops": [op.model_dump(mode="json") for op in applied]}
+
+@traced_node("enqueue_knowledge")
+def enqueue_knowledge_node(state: State):
+    job_id = knowledge_queue.enqueue(state["session_id"], state["input_text"])
+    return {"knowledge_job": job_id}
+
+def process_knowledge(session_id, input_text, job_id=None, replay=False):
+    # one write-behind job: the same two nodes the inline graph runs, against the memory as it is now,
+    # so jobs of one session see each other's writes in order.
+    # the session lock is only held to snapshot the memory and to apply the ops, never across the LLM chain,
+    # otherwise the user's next turn would wait on their own background job.
+    with sessions.acquire(session_id) as session:
+        if replay and session.applied_job(job_id):
+            logger.info("Knowledge job %s was already applied before it was interrupted, skipping it", job_id)
+            return
+        memory = session.memory.entries()
+
+    state = {"session_id": session_id, "input_text": input_text, "memory": memory, "knowledge_job": job_id}
+    # nobody is waiting on this answer, so it queues behind live turns.
+    with lm_lane("background", user=session_id):
+        state.update(knowledge_master_node(state))
+    if state["knowledge_master_response"] is None:
+        raise RuntimeError("KnowledgeMaster returned no output")
+
+    # acquire again: the session may have been evicted and reopened meanwhile, the node looks up the live one.
+    with sessions.acquire(session_id):
+        knowledge_modifier_node(state)
+
+knowledge_queue = KnowledgeQueue(os.environ.get("KNOWLEDGE_QUEUE_PATH", "local_cache/knowledge_queue.jsonl"), process_knowledge) if KNOWLEDGE_WRITE_BEHIND else None
+
+@traced_node("response_generator")
 def response_generator_node(state: State):#
-    memory = state["memory"]
     messages = state['messages']
     final_response = "Input good!"
     if "no" in state["relevance"].lower():
         final_response = "Input not relevant!"
 
-    return {"messages": messages, "final_response": final_response, "memory": memory}
+    return {"messages": messages, "final_response": final_response}
 
 workflow = StateGraph(State)
 workflow.add_node("input_analyzer", input_analyzer_node)
 workflow.add_node("knowledge_master", knowledge_master_node)
 workflow.add_node("response_generator", response_generator_node)
 workflow.add_node("knowledge_modifier", knowledge_modifier_node)
+workflow.add_node("enqueue_knowledge", enqueue_knowledge_node)
 
 workflow.set_entry_point("input_analyzer")
 
@@ -131,29 +178,36 @@ workflow.add_conditional_edges(
     "input_analyzer",
     lambda x: x["relevance"],
     {
-        "yes": "knowledge_master",
+        "yes": "enqueue_knowledge" if KNOWLEDGE_WRITE_BEHIND else "knowledge_master",
         "no": "response_generator",
     },
 )
 # workflow.add_edge("input_analyzer", "knowledge_master")
 workflow.add_edge("knowledge_master", "knowledge_modifier")
 workflow.add_edge("knowledge_modifier", "response_generator")
+workflow.add_edge("enqueue_knowledge", "response_generator")
 workflow.add_edge("response_generator", END)
 
-initial_state = {
-    "messages": [],
-    "memory": [],
-    "input_text": "",
-}
+def new_state(session, input_text):
+    return {
+        "session_id": session.session_id,
+        "messages": list(session.messages),
+        "input_text": input_text,
+    }
 
-def process_input(input_text: str):
-    initial_state["input_text"] = input_text
-    final_state = app.invoke(initial_state)
-    return final_state
+def process_input(input_text: str, session_id: str = DEFAULT_SESSION):
+    # the session lock serializes turns of one user, other sessions run the graph in parallel.
+    with sessions.acquire(session_id) as session:
+        final_state = app.invoke(new_state(session, input_text))
+        session.messages = final_state.get("messages") or session.messages
+        return final_state
 
 app = workflow.compile()
 
 if __name__ == "__main__":
+    registry.warm_up()
+    if KNOWLEDGE_WRITE_BEHIND:
+        knowledge_queue.start()
     while True:
         user_input = input("\nEnter your message (or 'quit' to exit): ").strip()
 
@@ -163,7 +217,6 @@ if __name__ == "__main__":
         state = process_input(user_input)
 
         print(f"\n\n final_state:")
-        initial_state["memory"] = state["memory"]
-        pprint(initial_state["memory"])
+        pprint(state.get("memory_ops", []))
         pprint(state["messages"])
         print(f"Input quality: {state["relevance"]}")
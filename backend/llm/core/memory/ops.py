@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+from typing import Annotated, Any, Dict, List, Literal, Union
+from pydantic import BaseModel, Field, TypeAdapter
+from llm.core.signatures.knowledge_signature import StatusEntry
+from llm.core.serialization import to_jsonable
+
+# Memory mutations as small typed operations. The knowledge modifier plans them, the store applies them one by
+# one, LangGraph carries them as a delta (memory_ops) instead of the whole memory list, and every applied op
+# lands in the session's audit log.
+
+class CreateMemoryOp(BaseModel):
+    op: Literal["create"] = "create"
+    id: str
+    entry: Dict[str, Any]
+
+class UpdateMemoryOp(BaseModel):
+    op: Literal["update"] = "update"
+    id: str
+    fields: Dict[str, Any]
+
+class DeleteMemoryOp(BaseModel):
+    op: Literal["delete"] = "delete"
+    id: str
+
+class DeleteMemoryDetailOp(BaseModel):
+    op: Literal["delete_detail"] = "delete_detail"
+    id: str
+    details: List[Dict[str, Any]]
+
+MemoryOp = Annotated[Union[CreateMemoryOp, UpdateMemoryOp, DeleteMemoryOp, DeleteMemoryDetailOp], Field(discriminator="op")]
+_op_adapter = TypeAdapter(MemoryOp)
+
+def parse_op(data):
+    return data if isinstance(data, BaseModel) else _op_adapter.validate_python(data)
+
+def _field(value, name):
+    return value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+
+def plan_memory_ops(output, context, create_id=None):
+    """
+    Translate a KnowledgeMaster result (output + context) into the ops to apply. Matched entries come from context['ex_knowledge'].
+    `create_id` replaces the model's id for a new memory, so a replayed job writes the same entry instead of a second one.
+    """
+    status = StatusEntry(output.status)
+    matched = context.get("ex_knowledge") or []
+    original_entry = output.original_entry or {}
+    # the first matched entry is the one the model meant, for now.
+    target_id = str(matched[0]["id"]) if matched else (str(_field(original_entry, "id")) if _field(original_entry, "id") else None)
+
+    if status == StatusEntry.CreateMemory:
+        entry = {
+            "id": str(create_id or output.id),
+            "content": output.content,
+            "category": output.category,
+            "status": StatusEntry.CreateMemory,
+            "details": output.details,
+            "original_entry": {},
+        }
+        return [CreateMemoryOp(id=entry["id"], entry=to_jsonable(entry))]
+
+    if target_id is None:
+        return []
+
+    if status == StatusEntry.UpdateMemory:
+        fields = {"status": StatusEntry.UpdateMemory, "content": output.content, "category": output.category, "details": list(output.details)}
+        return [UpdateMemoryOp(id=target_id, fields=to_jsonable(fields))]
+    if status == StatusEntry.DeleteMemory:
+        return [DeleteMemoryOp(id=target_id)]
+    if status == StatusEntry.DeleteMemoryDetail:
+        return [DeleteMemoryDetailOp(id=target_id, details=to_jsonable(_field(original_entry, "to_remove") or []))]
+    return []
+
+def apply_op(store, op):
+    """Apply one op to a MemoryStore. Returns False when it had nothing to act on (unknown id)."""
+    op = parse_op(op)
+    if isinstance(op, CreateMemoryOp):
+        store.put(op.entry)
+        return True
+    if op.id not in store:
+        return False
+    if isinstance(op, UpdateMemoryOp):
+        store.update(op.id, op.fields)
+    elif isinstance(op, DeleteMemoryOp):
+        store.delete(op.id)
+    elif isinstance(op, DeleteMemoryDetailOp):
+        return bool(store.remove_details(op.id, op.details))
+    return True
+
+
+class MemoryAudit:
+    """Append-only JSONL trail of every memory op applied to a session, kept apart from the (compacted) store log."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(filepath, 'a')
+
+    def record(self, op, applied, **context):
+        line = json.dumps({"at": time.time(), "applied": applied, **context, **parse_op(op).model_dump(mode="json")}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def read(self):
+        with self._lock, open(self.filepath) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
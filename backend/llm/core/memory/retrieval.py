@@ -0,0 +1,133 @@
+import math
+import re
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9$]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "i", "in", "is", "it", "my", "of",
+    "on", "or", "so", "that", "the", "to", "was", "with", "want", "will", "me", "im", "ive", "am", "have",
+}
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall((text or "").lower().replace("'", "")) if token not in _STOPWORDS]
+
+def _field(entry, name):
+    if isinstance(entry, dict):
+        return entry.get(name)
+    return getattr(entry, name, None)
+
+def entry_text(entry):
+    # compact rows already hold the reason strings, no need to walk detail dicts.
+    if hasattr(entry, "reasons"):
+        return " ".join((entry.content or "",) + tuple(reason for reason in entry.reasons if reason))
+    reasons = []
+    for detail in _field(entry, "details") or []:
+        reason = _field(detail, "reason")
+        if reason:
+            reasons.append(reason)
+    return " ".join([_field(entry, "content") or ""] + reasons)
+
+
+class LocalEmbeddingIndex:
+    """
+    Optional dense scorer backed by a local sentence-transformers model.
+    Embeddings are cached per entry so each memory is only encoded once.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("LocalEmbeddingIndex needs `pip install sentence-transformers`") from e
+        self.model = SentenceTransformer(model_name)
+        self._cache = {}
+
+    def _encode(self, texts):
+        return self.model.encode(texts, normalize_embeddings=True)
+
+    def similarities(self, query, keys, texts):
+        missing = [(key, text) for key, text in zip(keys, texts) if key not in self._cache]
+        if missing:
+            for (key, _), vector in zip(missing, self._encode([text for _, text in missing])):
+                self._cache[key] = vector
+        query_vector = self._encode([query])[0]
+        return [float(self._cache[key] @ query_vector) for key in keys]
+
+
+class CandidateRetriever:
+    """
+    Cheap local pre-filter in front of CheckOriginalEntry.
+    Ranks existing entries with BM25 against the input text + analysis (optionally blended with a local
+    embedding similarity), gives a small boost to entries in the analyzed category and keeps the top k.
+    The category is only a boost: a delete or update is often analyzed under a different category
+    (e.g. JournalEntry) than the entry it points at.
+    """
+
+    def __init__(self, k=8, k1=1.5, b=0.75, category_boost=0.3, embedding_index=None, embedding_weight=1.0, max_cached_entries=100_000):
+        self.k = k
+        self.k1 = k1
+        self.b = b
+        self.category_boost = category_boost
+        self.embedding_index = embedding_index
+        self.embedding_weight = embedding_weight
+        self.max_cached_entries = max_cached_entries
+        self._token_cache = {}
+
+    def _tokens(self, key, text):
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            if len(self._token_cache) >= self.max_cached_entries:
+                # entries are keyed by (id, text), so stale versions pile up after updates.
+                self._token_cache.clear()
+            tokens = Counter(tokenize(text))
+            self._token_cache[key] = tokens
+        return tokens
+
+    def bm25_scores(self, query, keys, texts):
+        docs = [self._tokens(key, text) for key, text in zip(keys, texts)]
+        if not docs:
+            return []
+
+        avg_len = sum(sum(doc.values()) for doc in docs) / len(docs) or 1.0
+        document_frequency = Counter()
+        for doc in docs:
+            document_frequency.update(doc.keys())
+
+        scores = []
+        query_terms = set(tokenize(query))
+        for doc in docs:
+            doc_len = sum(doc.values())
+            score = 0.0
+            for term in query_terms:
+                tf = doc.get(term, 0)
+                if tf == 0:
+                    continue
+                idf = math.log(1 + (len(docs) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_len / avg_len))
+            scores.append(score)
+        return scores
+
+    def rank(self, query, entries, category=None):
+        texts = [entry_text(entry) for entry in entries]
+        keys = [(str(_field(entry, "id")), text) for entry, text in zip(entries, texts)]
+
+        lexical = self.bm25_scores(query, keys, texts)
+        top = max(lexical, default=0.0) or 1.0
+        scores = [score / top for score in lexical]
+
+        if self.embedding_index is not None:
+            dense = self.embedding_index.similarities(query, keys, texts)
+            scores = [score + self.embedding_weight * similarity for score, similarity in zip(scores, dense)]
+
+        if category:
+            scores = [score + (self.category_boost if _field(entry, "category") == category else 0.0) for score, entry in zip(scores, entries)]
+
+        # stable sort keeps memory order for ties, so the shortlist is deterministic.
+        order = sorted(range(len(entries)), key=lambda i: -scores[i])
+        return [(entries[i], scores[i]) for i in order]
+
+    def select(self, query, entries, category=None, k=None):
+        k = k or self.k
+        if len(entries) <= k:
+            return list(entries)
+        return [entry for entry, _ in self.rank(query, entries, category)[:k]]
@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from llm.core.serialization import to_jsonable
+from llm.core.memory.table import CompactEntry, pack_id
+
+def detail_key(reason):
+    """Normalized detail text: case, punctuation and spacing differences don't make two details different."""
+    return " ".join(re.findall(r"\w+", (reason or "").lower()))
+
+def detail_id(entry_id, reason):
+    # derived from the text, so the same detail keeps its id across updates that rewrite the details list.
+    return hashlib.sha1(f"{entry_id}:{detail_key(reason)}".encode("utf-8")).hexdigest()[:12]
+
+class MemoryStore:
+    """
+    Local document store for memory entries (Entry / KnowledgeMasterOutput shaped dicts).
+
+    Every mutation is appended to a JSONL log and fsynced before returning, so the log is the source of truth.
+    In memory we keep an id -> (offset, length) index into the log plus secondary indexes on category and
+    status, which makes get/update/delete by id O(1). Overwritten and deleted records are dead weight in
+    the log; once they outnumber the live ones the log is compacted into a fresh file.
+
+    The fields the graph reads every turn (id, category, status, content, detail reasons) are also kept as
+    compact slotted rows (see table.py), so entries() hands out the whole memory without touching the log or
+    building dicts. Details get a stable `detail_id` kept on the row, so removing k details resolves them in
+    O(k) without asking the model.
+
+    A crash can only ever tear the last record (we only append), so on open a trailing partial line is dropped.
+    """
+
+    def __init__(self, filepath, compact_ratio=1.0, min_compact_records=256, fsync=True):
+        self.filepath = filepath
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+        self.fsync = fsync
+
+        self._lock = threading.RLock()
+        # every index is keyed by the packed id (16 bytes for UUIDs, see table.pack_id), shared with the row.
+        self._offsets = {}  # packed id -> (offset, length) of the latest put record
+        self._rows = {}  # packed id -> CompactEntry, also what keeps the secondary indexes in sync
+        self._by_category = {}
+        self._by_status = {}
+        self._dead_records = 0
+
+        directory = os.path.dirname(os.path.abspath(filepath))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._open_handles()
+
+    # --- public api ---
+
+    def put(self, entry):
+        record = self._normalize(entry)
+        with self._lock:
+            self._append({"op": "put", "id": record["id"], "entry": record})
+        return record["id"]
+
+    def get(self, entry_id):
+        with self._lock:
+            location = self._offsets.get(pack_id(entry_id))
+            if location is None:
+                return None
+            return self._read(*location)
+
+    def update(self, entry_id, fields):
+        with self._lock:
+            current = self.get(entry_id)
+            if current is None:
+                raise KeyError(f"Memory {entry_id} does not exist")
+            current.update(to_jsonable(fields))
+            current["id"] = str(entry_id)
+            self._assign_detail_ids(current)
+            self._append({"op": "put", "id": current["id"], "entry": current})
+            return current
+
+    def delete(self, entry_id):
+        entry_id = str(entry_id)
+        with self._lock:
+            if pack_id(entry_id) not in self._offsets:
+                return False
+            self._append({"op": "del", "id": entry_id})
+            return True
+
+    def remove_details(self, entry_id, details):
+        """
+        Remove details from an entry in place. `details` are detail dicts (or plain strings) referencing
+        a detail by `detail_id` or by its reason text. Returns the ids that were actually removed.
+        """
+        entry_id = str(entry_id)
+        with self._lock:
+            row = self._rows.get(pack_id(entry_id))
+            if row is None:
+                raise KeyError(f"Memory {entry_id} does not exist")
+            # a handful of details per entry, the row's id tuple is the index.
+            index = row.detail_ids
+            to_remove = set()
+            for detail in details:
+                if isinstance(detail, str):
+                    detail = {"reason": detail}
+                candidate = detail.get("detail_id") or detail_id(entry_id, detail.get("reason"))
+                if candidate in index:
+                    to_remove.add(candidate)
+            if not to_remove:
+                return []
+
+            current = self.get(entry_id)
+            self._assign_detail_ids(current)
+            current["details"] = [detail for detail in current.get("details") or [] if detail["detail_id"] not in to_remove]
+            self._append({"op": "put", "id": entry_id, "entry": current})
+            return sorted(to_remove)
+
+    def by_category(self, category):
+        with self._lock:
+            return [self._read(*self._offsets[key]) for key in self._by_category.get(category, ())]
+
+    def by_status(self, status):
+        with self._lock:
+            return [self._read(*self._offsets[key]) for key in self._by_status.get(to_jsonable(status), ())]
+
+    def all(self):
+        """Full records read back from the log, for the API. The graph uses entries()."""
+        with self._lock:
+            return [self._read(*location) for location in self._offsets.values()]
+
+    def entries(self):
+        # rows are replaced on every put, never mutated, so sharing them across threads is safe.
+        with self._lock:
+            return list(self._rows.values())
+
+    def __contains__(self, entry_id):
+        return pack_id(entry_id) in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def compact(self):
+        with self._lock:
+            tmp_filepath = f"{self.filepath}.compact"
+            entries = self.all()
+            with open(tmp_filepath, 'wb') as f:
+                for entry in entries:
+                    f.write(self._encode({"op": "put", "id": entry["id"], "entry": entry}))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._close_handles()
+            os.replace(tmp_filepath, self.filepath)
+            self._fsync_directory()
+            self._reset_indexes()
+            self._load()
+            self._open_handles()
+
+    def close(self):
+        with self._lock:
+            self._close_handles()
+
+    # --- internals ---
+
+    def _normalize(self, entry):
+        record = to_jsonable(entry)
+        if not isinstance(record, dict):
+            raise TypeError(f"Cannot store memory of type {type(entry).__name__}")
+        if record.get("id") is None:
+            raise ValueError("Memory entries need an id")
+        record["id"] = str(record["id"])
+        self._assign_detail_ids(record)
+        return record
+
+    def _assign_detail_ids(self, record):
+        details = record.get("details") or []
+        record["details"] = [
+            {**detail, "detail_id": detail.get("detail_id") or detail_id(record["id"], detail.get("reason"))}
+            for detail in details if isinstance(detail, dict)
+        ]
+
+    def _encode(self, record):
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _append(self, record):
+        data = self._encode(record)
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._apply(record, offset, len(data))
+
+        if self._dead_records >= self.min_compact_records and self._dead_records > len(self._offsets) * self.compact_ratio:
+            self.compact()
+
+    def _apply(self, record, offset, length):
+        entry_id = record["id"]
+        key = pack_id(entry_id)
+        if key in self._offsets:
+            self._unindex(key)
+            self._dead_records += 1
+
+        if record["op"] == "put":
+            entry = record["entry"]
+            self._offsets[key] = (offset, length)
+            self._by_category.setdefault(entry.get("category"), {})[key] = None
+            self._by_status.setdefault(entry.get("status"), {})[key] = None
+            details = [detail for detail in entry.get("details") or [] if isinstance(detail, dict)]
+            # logs written before detail ids existed get the same derived ids on load.
+            ids = [detail.get("detail_id") or detail_id(entry_id, detail.get("reason")) for detail in details]
+            self._rows[key] = CompactEntry(key, entry.get("category"), entry.get("status"), entry.get("content"), (detail.get("reason") for detail in details), ids)
+        else:
+            # the delete record itself is dead weight too.
+            self._dead_records += 1
+
+    def _unindex(self, key):
+        del self._offsets[key]
+        row = self._rows.pop(key)
+        category, status = row.category, row.status
+        self._by_category.get(category, {}).pop(key, None)
+        self._by_status.get(status, {}).pop(key, None)
+
+    def _read(self, offset, length):
+        self._reader.seek(offset)
+        return json.loads(self._reader.read(length))["entry"]
+
+    def _open_handles(self):
+        self._file = open(self.filepath, 'ab')
+        self._reader = open(self.filepath, 'rb')
+
+    def _close_handles(self):
+        self._file.close()
+        self._reader.close()
+
+    def _load(self):
+        if not os.path.exists(self.filepath):
+            return
+
+        offset = 0
+        with open(self.filepath, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("partial record")
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write from a crash, everything from here on is garbage.
+                    print(f"Dropping partial record at offset {offset} in {self.filepath}")
+                    break
+                self._apply(record, offset, len(line))
+                offset += len(line)
+
+        if offset != os.path.getsize(self.filepath):
+            with open(self.filepath, 'r+b') as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+
+    def _reset_indexes(self):
+        self._offsets = {}
+        self._rows = {}
+        self._by_category = {}
+        self._by_status = {}
+        self._dead_records = 0
+
+    def _fsync_directory(self):
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.filepath)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,111 @@
+import sys
+import threading
+from uuid import UUID
+
+class CodeBook:
+    """Interns a small vocabulary (categories, statuses) as small ints, so rows carry an int instead of a str."""
+
+    def __init__(self, values=()):
+        self._codes = {}
+        self._values = []
+        self._lock = threading.Lock()
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def value(self, code):
+        return self._values[code]
+
+
+# seeded with the known vocabularies so their codes are stable across processes, anything else is added on first use.
+CATEGORY_CODES = CodeBook([None, "ShortTermGoals", "MediumTermGoals", "LongTermGoals", "Task", "JournalEntry", "UserAttribute"])
+STATUS_CODES = CodeBook([None, "CreateMemory", "UpdateMemory", "DeleteMemory", "DeleteMemoryDetail"])
+
+def pack_id(entry_id):
+    # 16 raw bytes for UUIDs, ids that aren't UUIDs (old data, tests) are kept as their string.
+    # The MemoryStore keys its indexes by this too, so one packed id object is shared by the row and every index.
+    if isinstance(entry_id, bytes):
+        return entry_id
+    try:
+        return UUID(str(entry_id)).bytes
+    except ValueError:
+        return sys.intern(str(entry_id))
+
+def unpack_id(packed):
+    return str(UUID(bytes=packed)) if isinstance(packed, bytes) else packed
+
+
+class CompactEntry:
+    """
+    Read-only, slotted row for one memory: binary id, interned category/status codes, content and a tuple of
+    detail reasons (+ their detail ids). It answers entry["field"] / entry.get("field") like the dicts it replaces,
+    so the graph and retrieval code take it as is; to_dict()/to_entry() build the heavy forms only when asked.
+    """
+
+    __slots__ = ("_id", "_category", "_status", "content", "reasons", "detail_ids")
+    FIELDS = ("id", "category", "content", "status", "details")
+
+    def __init__(self, entry_id, category, status, content, reasons=(), detail_ids=()):
+        self._id = pack_id(entry_id)
+        self._category = CATEGORY_CODES.code(category)
+        self._status = STATUS_CODES.code(status)
+        self.content = content
+        self.reasons = tuple(reasons)
+        self.detail_ids = tuple(detail_ids)
+
+    @classmethod
+    def from_dict(cls, entry):
+        details = [detail for detail in entry.get("details") or [] if isinstance(detail, dict)]
+        return cls(
+            entry["id"],
+            entry.get("category"),
+            entry.get("status"),
+            entry.get("content"),
+            reasons=(detail.get("reason") for detail in details),
+            detail_ids=(detail.get("detail_id") for detail in details),
+        )
+
+    @property
+    def id(self):
+        return unpack_id(self._id)
+
+    @property
+    def category(self):
+        return CATEGORY_CODES.value(self._category)
+
+    @property
+    def status(self):
+        return STATUS_CODES.value(self._status)
+
+    @property
+    def details(self):
+        return [{"reason": reason, "detail_id": detail_id} for reason, detail_id in zip(self.reasons, self.detail_ids)]
+
+    def __getitem__(self, name):
+        if name not in self.FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self.FIELDS else default
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def to_entry(self):
+        # imported here, the signatures module pulls in dspy and the storage layer shouldn't need it.
+        from llm.core.signatures.knowledge_signature import Entry
+        return Entry(**self.to_dict())
+
+    def __repr__(self):
+        return f"CompactEntry(id={self.id!r}, category={self.category!r}, status={self.status!r}, content={self.content!r})"
@@ -1,43 +1,153 @@
 import dspy
 from pprint import pprint
-import json
-import re
-from llm.core.signatures.knowledge_signature import KnowledgeMasterOutput, OutputDetails, Entry, AnalyzeInput, ExtractDetails, CheckOriginalEntry, MergeKnowledge, FinalizeOutput
+from llm.core.signatures.knowledge_signature import CATEGORIES, KnowledgeMasterOutput, KnowledgeMasterSignature, OutputDetails, Entry, StatusEntry, AnalyzeInput, ExtractDetails, CheckOriginalEntry, MergeKnowledge, FinalizeOutput
+from llm.core.memory.retrieval import CandidateRetriever
+from llm.core.concurrency import run_stages
+from llm.core.structured_output import parse_structured, parse_model_list
+from llm.core.lm.cascade import run_stage
+from llm.core.memory.store import detail_key
+from llm.core.observability import metrics
 from uuid import uuid4, UUID
 
+# what a stage output has to look like before we keep the small model's answer (see lm/cascade.py).
+def valid_analysis(prediction):
+    return prediction.category in CATEGORIES and bool(prediction.content) and StatusEntry(prediction.status) is not None
+
+def valid_details(prediction):
+    return isinstance(prediction.details, list) and all(getattr(detail, "reason", None) for detail in prediction.details)
+
+def valid_match(prediction):
+    parse_structured(prediction.match_entry)
+    return True
+
 class KnowledgeMaster(dspy.Module):
 
-    def __init__(self):
+    def __init__(self, candidate_k=8, retriever=None, concurrent=True, mode="staged"):
         super().__init__()
+        # "staged" runs analyze -> extract_details/check_original -> merge -> finalize (up to five calls),
+        # "fused" asks KnowledgeMasterSignature for the whole output in one call and falls back to staged
+        # when that output doesn't validate.
+        if mode not in ("staged", "fused"):
+            raise ValueError(f"Unknown KnowledgeMaster mode: {mode}")
+        self.mode = mode
+        # extract_details and check_original only depend on analyze, so they can run side by side.
+        self.concurrent = concurrent
+        # only the top candidate_k memories are shown to check_original, not the whole memory.
+        self.retriever = retriever or CandidateRetriever(k=candidate_k)
         self.analyze = dspy.ChainOfThought(AnalyzeInput)#
         self.extract_details = dspy.ChainOfThought(ExtractDetails)#
         self.check_original = dspy.ChainOfThought(CheckOriginalEntry)
         self.merge = dspy.ChainOfThought(MergeKnowledge)
         self.finalize = dspy.ChainOfThought(FinalizeOutput)
+        self.fused = dspy.ChainOfThought(KnowledgeMasterSignature)
+
+    def forward(self, input_text, existing_knowledge, analyzed_input=None):
+        # analyzed_input: the analyze stage's prediction when it already ran (speculatively, next to relevance).
+        if self.mode == "fused":
+            fused = self.fused_forward(input_text, existing_knowledge)
+            if fused is not None:
+                return fused
+            print("Fused output failed validation, falling back to the staged pipeline.")
+        return self.staged_forward(input_text, existing_knowledge, analyzed_input)
+
+    def fused_forward(self, input_text, existing_knowledge):
+        try:
+            candidates = []
+            if len(existing_knowledge) > 0 and existing_knowledge[0]["category"] is not None:
+                candidates = self.retriever.select(query=input_text, entries=existing_knowledge)
+
+            prediction = self.fused(input_text=input_text, existing_knowledge=self.serialize_entries(candidates))
+            output = prediction.output
+            if isinstance(output, dict):
+                output = KnowledgeMasterOutput(**output)
+            ex_knowledge = self.validate_fused_output(output, candidates)
+
+            return {"output": output, "context": { "ex_knowledge": ex_knowledge, "compared": {}, "analyzed_input": None, "mode": "fused" }}
 
-    def forward(self, input_text, existing_knowledge):
+        except Exception as e:
+            pprint(e)
+
+    def validate_fused_output(self, output, candidates):
+        if output.category not in CATEGORIES:
+            raise ValueError(f"invalid category {output.category}")
+        if not output.content:
+            raise ValueError("empty content")
+        if StatusEntry(output.status) == StatusEntry("CreateMemory"):
+            return []
+
+        # anything other than a create has to point at one of the memories we showed the model.
+        original_id = output.original_entry.get("id") if isinstance(output.original_entry, dict) else getattr(output.original_entry, "id", None)
+        matches = [entry for entry in candidates if str(entry["id"]) == str(original_id)]
+        if not matches:
+            raise ValueError(f"{output.status} references unknown memory {original_id}")
+        return matches
+
+    def staged_forward(self, input_text, existing_knowledge, analyzed_input=None):
         try:
             instruc = "Create a new Entry"
             merged = {}
 
-            analyzed_input = self.analyze(input_text=input_text)
-            input_details = self.extract_details(input_text=input_text, category=analyzed_input["category"], content=analyzed_input["content"], status=analyzed_input.status.value)
-            ex_knowledge = self.check_existing_knowledge(input_text=input_text, input_analysis=analyzed_input.reasoning, existing_knowledge=existing_knowledge)
+            if analyzed_input is None:
+                analyzed_input = self.analyze_input(input_text)
+            stages = {
+                "extract_details": lambda: run_stage("extract_details", lambda: self.extract_details(input_text=input_text, category=analyzed_input["category"], content=analyzed_input["content"], status=analyzed_input.status.value), valid_details),
+                "check_existing_knowledge": lambda: self.check_existing_knowledge(input_text=input_text, input_analysis=analyzed_input.reasoning, existing_knowledge=existing_knowledge, category=analyzed_input["category"], content=analyzed_input["content"]),
+            }
+            if self.concurrent:
+                results = run_stages(stages)
+            else:
+                results = {name: stage() for name, stage in stages.items()}
+            input_details = results["extract_details"]
+            ex_knowledge = results["check_existing_knowledge"]
             cur_entry = self.combined_entry(analyzed_input, input_details)
 
+            removal = self.exact_detail_removal(analyzed_input, input_details, ex_knowledge)
+            if removal is not None:
+                output, entry = removal
+                metrics.inc("mentor_knowledge_detail_fast_path_total", help="DeleteMemoryDetail turns that skipped merge/finalize")
+                return {"output": output, "context": { "ex_knowledge": [entry], "compared": {}, "analyzed_input": analyzed_input, "mode": "detail_fast_path" }}
+
             if len(ex_knowledge) > 0:
                 # we need to compare current entry to existing knowledge to find the entry to be deleted or updated.
-                merged = self.merge(old_knowledge=ex_knowledge, new_knowledge=cur_entry)
+                merged = run_stage("merge", lambda: self.merge(old_knowledge=ex_knowledge, new_knowledge=cur_entry), lambda prediction: bool(prediction.reasoning))
                 instruc = merged.reasoning
 
             finalize = self.format_finalize(instructions_to_follow=instruc, combined_new_entry=cur_entry, existing_knowledge_match=merged)
             final_response = self.final_response(finalize, merged)
 
-            return {"output": final_response, "context": { "ex_knowledge": ex_knowledge, "compared": merged, "analyzed_input": analyzed_input }}
+            return {"output": final_response, "context": { "ex_knowledge": ex_knowledge, "compared": merged, "analyzed_input": analyzed_input, "mode": "staged" }}
 
         except Exception as e:
             pprint(e)
 
+    def analyze_input(self, input_text):
+        # the analyze stage on its own, also what the speculative path starts next to relevance.
+        return run_stage("analyze", lambda: self.analyze(input_text=input_text), valid_analysis)
+
+    def exact_detail_removal(self, analyzed_input, input_details, ex_knowledge):
+        # the user wants a detail gone and it matches one we already hold word for word,
+        # merge/finalize would only be asked to copy it into to_remove, so build the output here.
+        if StatusEntry(analyzed_input.status) != StatusEntry.DeleteMemoryDetail or not ex_knowledge:
+            return None
+        wanted = {detail_key(detail.reason) for detail in input_details.details} | {detail_key(analyzed_input["content"])}
+        wanted.discard("")
+
+        for entry in ex_knowledge:
+            details = entry.get("details") or []
+            to_remove = [detail for detail in details if detail_key(detail.get("reason")) in wanted]
+            if not to_remove:
+                continue
+            output = KnowledgeMasterOutput(
+                id=entry["id"],
+                category=entry.get("category") or analyzed_input["category"],
+                content=entry.get("content") or analyzed_input["content"],
+                status=StatusEntry.DeleteMemoryDetail,
+                details=[OutputDetails(reason=detail["reason"]) for detail in details if detail not in to_remove],
+                original_entry=Entry(**{**entry, "to_remove": to_remove}),
+            )
+            return output, entry
+        return None
+
     def final_response(self, finalize, merged):
         return KnowledgeMasterOutput(
                 id=finalize["id"],
@@ -63,36 +173,40 @@ class KnowledgeMaster(dspy.Module):
 
     def format_finalize(self, instructions_to_follow, combined_new_entry, existing_knowledge_match):
         try:
-            return self.finalize(instructions_to_follow=instructions_to_follow, combined_new_entry=combined_new_entry, existing_knowledge_match=existing_knowledge_match)
+            return run_stage("finalize", lambda: self.finalize(instructions_to_follow=instructions_to_follow, combined_new_entry=combined_new_entry, existing_knowledge_match=existing_knowledge_match),
+                             lambda prediction: prediction.category in CATEGORIES and StatusEntry(prediction.status) is not None)
         except Exception as e:
             pprint(e)
 
-    def check_existing_knowledge(self, input_text, input_analysis, existing_knowledge):
+    def check_existing_knowledge(self, input_text, input_analysis, existing_knowledge, category=None, content=""):
         ex_knowledge = []
         # this is a temp measure to make sure we have a valid existing_knowledge
         if len(existing_knowledge) > 0 and existing_knowledge[0]["category"] is not None:
-            entry_obj = [
-                {
-                    "id": entry["id"],
-                    "category": entry["category"],
-                    "content": entry["content"],
-                    "status": entry["status"],
-                    "details": [
-                        {
-                            "reason": detail.reason if isinstance(entry["details"][0], OutputDetails) else detail["reason"]
-                        } for detail in entry["details"]] if len(entry["details"]) > 0 else []
-                } for entry in existing_knowledge]
-
-            knowledge = self.check_original(input_text=input_text, input_analysis=input_analysis, compare_existing_entries_with_input_text_intent=entry_obj)
-
-            # TODO: for now we do this hacky thing
-            if isinstance(knowledge.match_entry, str):
-                not_back = re.sub(r"\'", '"', knowledge.match_entry)
-                formatted = not_back.replace("'", '"')
-                json_loaded = json.loads(formatted)
-                if isinstance(json_loaded, dict):
-                    ex_knowledge = [json_loaded]
-                else:
-                    ex_knowledge = json_loaded
-
-        return ex_knowledge
\ No newline at end of file
+            candidates = self.retriever.select(query=f"{input_text} {content}", entries=existing_knowledge, category=category)
+            entry_obj = self.serialize_entries(candidates)
+
+            knowledge = run_stage("check_original", lambda: self.check_original(input_text=input_text, input_analysis=input_analysis, compare_existing_entries_with_input_text_intent=entry_obj), valid_match)
+
+            # the model answers in JSON or Python literals, sometimes truncated, validated into Entry either way.
+            entries = parse_model_list(knowledge.match_entry, Entry, field="match_entry")
+            # Entry.id has a default, so a fragment or an invented memory would validate; only keep ones we showed.
+            shown = {str(entry["id"]) for entry in candidates}
+            matched = [entry for entry in entries if str(entry.id) in shown]
+            if len(matched) < len(entries):
+                metrics.inc("mentor_knowledge_unknown_matches_total", len(entries) - len(matched), help="check_original matches dropped for pointing at no candidate")
+            ex_knowledge = [entry.model_dump(mode="json") for entry in matched]
+
+        return ex_knowledge
+
+    def serialize_entries(self, entries):
+        return [
+            {
+                "id": entry["id"],
+                "category": entry["category"],
+                "content": entry["content"],
+                "status": entry["status"],
+                "details": [
+                    {
+                        "reason": detail.reason if isinstance(entry["details"][0], OutputDetails) else detail["reason"]
+                    } for detail in entry["details"]] if len(entry["details"]) > 0 else []
+            } for entry in entries]
\ No newline at end of file
@@ -1,5 +1,8 @@
+import re
+import json
 import dspy
-from llm.core.signatures.relevance_signature import RelevanceClassifier
+from llm.core.signatures.relevance_signature import RelevanceClassifier, BatchRelevanceClassifier
+from llm.core.lm.cascade import run_stage
 
 class RelevanceModule(dspy.Module):
     def __init__(self):
@@ -7,7 +10,8 @@ class RelevanceModule(dspy.Module):
         self.classifier = dspy.ChainOfThought(RelevanceClassifier)
 
     def forward(self, input_text):
-        classification = self.classifier(input_text=input_text.input_text)
+        classification = run_stage("relevance", lambda: self.classifier(input_text=input_text.input_text),
+                                   lambda prediction: prediction.relevance.strip().upper() in ["TRUE", "FALSE"])
         relevance = classification.relevance.strip().upper()
         explanation = classification.explanation
         thoughts = classification.thoughts
@@ -16,4 +20,41 @@ class RelevanceModule(dspy.Module):
         if relevance not in ["TRUE", "FALSE"]:
             relevance = "FALSE"
 
-        return dspy.Prediction(relevance=relevance, explanation=explanation, thoughts=thoughts, category=category)
\ No newline at end of file
+        return dspy.Prediction(relevance=relevance, explanation=explanation, thoughts=thoughts, category=category)
+
+class BatchRelevanceModule(dspy.Module):
+    """Classifies several inputs with one LLM call. Items the output doesn't cover come back as None."""
+
+    def __init__(self):
+        super().__init__()
+        self.classifier = dspy.Predict(BatchRelevanceClassifier)
+
+    def forward(self, inputs):
+        packed = json.dumps([{"index": i, "text": text} for i, text in enumerate(inputs)])
+        raw = self.classifier(inputs=packed).classifications
+        return parse_batch_classifications(raw, len(inputs))
+
+def parse_batch_classifications(raw, count):
+    results = [None] * count
+    # models like to wrap JSON in a code fence, or to chat before it.
+    match = re.search(r"\[.*\]", raw or "", re.S)
+    try:
+        items = json.loads(match.group(0)) if match else []
+    except json.JSONDecodeError:
+        items = []
+
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        if not isinstance(index, int) or not 0 <= index < count or results[index] is not None:
+            continue
+        relevance = str(item.get("relevance", "")).strip().upper()
+        if relevance not in ["TRUE", "FALSE"]:
+            continue
+        results[index] = dspy.Prediction(
+            relevance=relevance,
+            category=str(item.get("category", "")).strip(),
+            explanation=str(item.get("explanation", "")).strip(),
+        )
+    return results
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import wraps
+import dspy
+from llm.core.lm.base import WrappedLM
+from llm.core.lm.cache import last_call_was_cached, last_call_was_coalesced
+from llm.core.serialization import to_jsonable
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def estimate_tokens(text):
+    return max(1, len(text or "") // 4)
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}" if labels else ""
+
+
+class Metrics:
+    """Tiny in-process metrics registry rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # name -> {labels: value}
+        self._histograms = {}  # name -> {labels: [bucket counts..., sum, count]}
+        self._gauges = {}  # name -> {labels: value}
+        self._help = {}
+        self._collectors = []  # called before every render to refresh gauges (queue depth, lag, ...)
+
+    def inc(self, name, value=1, help="", **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            key = _labels_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, help="", **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def observe(self, name, value, help="", buckets=DEFAULT_BUCKETS, **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._histograms.setdefault(name, {})
+            key = _labels_key(labels)
+            if key not in series:
+                series[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            histogram = series[key]
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self):
+        self._collect()
+        with self._lock:
+            return {
+                "counters": {name: {_format_labels(k): v for k, v in series.items()} for name, series in self._counters.items()},
+                "gauges": {name: {_format_labels(k): v for k, v in series.items()} for name, series in self._gauges.items()},
+                "histograms": {
+                    name: {_format_labels(k): {"sum": h["sum"], "count": h["count"]} for k, h in series.items()}
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def _collect(self):
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e!r}")
+
+    def render(self):
+        self._collect()
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in self._gauges.items():
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in self._histograms.items():
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class TraceWriter:
+    """
+    Appends one JSON object per span to a JSONL file. Disabled when no path is given.
+    Once the file passes `max_bytes` it is rotated to `<path>.1` (replacing the previous one), so at most
+    about twice that stays on disk.
+    """
+
+    def __init__(self, filepath=None, max_bytes=50 * 1024 * 1024):
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        if filepath:
+            os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+            self._file = open(filepath, 'a')
+
+    def write(self, span):
+        if self._file is None:
+            return
+        line = json.dumps(span, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        # caller holds the lock.
+        self._file.close()
+        os.replace(self.filepath, self.filepath + ".1")
+        self._file = open(self.filepath, 'a')
+
+
+class Span:
+    """Per-node accumulator the LM layer reports into, shared with worker threads through dspy settings."""
+
+    def __init__(self, name):
+        self.name = name
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add_call(self, seconds, prompt_tokens, completion_tokens, cache_hit, error):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cache_hits += int(cache_hit)
+            self.errors += int(error)
+
+
+metrics = Metrics()
+# off unless TRACE_PATH is set (e.g. local_cache/traces.jsonl), metrics don't depend on it.
+tracer = TraceWriter(os.environ.get("TRACE_PATH"), max_bytes=int(os.environ.get("TRACE_MAX_BYTES", 50 * 1024 * 1024)))
+
+# signature instructions -> "module.predictor", so an LM call can be attributed to the predictor that made it.
+_predictor_names = {}
+_label_cache = {}
+
+def register_predictors(module, prefix):
+    for name, predictor in module.named_predictors():
+        instructions = (predictor.signature.instructions or "").strip()
+        if instructions:
+            _predictor_names[instructions] = f"{prefix}.{name.split('.')[0]}"
+    _label_cache.clear()
+
+def predictor_label(messages):
+    system = messages[0]["content"] if messages else ""
+    key = hashlib.sha1(system.encode("utf-8")).hexdigest()
+    label = _label_cache.get(key)
+    if label is None:
+        # longest instructions first, so a signature whose docstring contains another one still wins.
+        label = next((name for instructions, name in sorted(_predictor_names.items(), key=lambda item: -len(item[0])) if instructions in system), "unknown")
+        _label_cache[key] = label
+    return label
+
+def traced_node(name):
+    """Decorator for LangGraph nodes: wall time, LLM time/tokens/cache hits inside the node and update size."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(state):
+            span = Span(name)
+            started_at = time.time()
+            start = time.perf_counter()
+            update, error = None, None
+            try:
+                # lm_user: the LM scheduler shares each lane fairly between sessions.
+                with dspy.settings.context(trace_span=span, lm_user=state.get("session_id")):
+                    update = fn(state)
+                return update
+            except Exception as e:
+                error = repr(e)
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                payload_bytes = len(json.dumps(to_jsonable(update), default=str)) if error is None else 0
+                metrics.observe("mentor_node_duration_seconds", seconds, help="Wall time of a LangGraph node", node=name)
+                metrics.inc("mentor_node_payload_bytes_total", payload_bytes, help="Bytes of state returned by a node", node=name)
+                metrics.inc("mentor_node_runs_total", help="LangGraph node runs", node=name, outcome="error" if error else "ok")
+                tracer.write({
+                    "type": "node", "name": name, "session_id": state.get("session_id"), "started_at": started_at,
+                    "duration_s": seconds, "llm_calls": span.llm_calls, "llm_s": span.llm_seconds,
+                    "prompt_tokens": span.prompt_tokens, "completion_tokens": span.completion_tokens,
+                    "cache_hits": span.cache_hits, "llm_errors": span.errors, "payload_bytes": payload_bytes, "error": error,
+                })
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedLM(WrappedLM):
+    """Records latency, token counts, cache hits, coalesced followers and errors for every LM call, labelled by predictor."""
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        label = predictor_label(messages or [])
+        started_at = time.time()
+        start = time.perf_counter()
+        outputs, error = None, None
+        try:
+            outputs = self.lm(prompt=prompt, messages=messages, **kwargs)
+            return outputs
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            cache_hit = error is None and last_call_was_cached()
+            # a follower of a coalesced request sent nothing, the leader's call already counted the tokens.
+            coalesced = not cache_hit and last_call_was_coalesced()
+            prompt_tokens, completion_tokens = (0, 0) if coalesced else self._usage(messages, prompt, outputs, cache_hit)
+            outcome = "error" if error else ("cache_hit" if cache_hit else ("coalesced" if coalesced else "ok"))
+
+            metrics.observe("mentor_llm_request_duration_seconds", seconds, help="LM call latency", predictor=label)
+            metrics.inc("mentor_llm_requests_total", help="LM calls", predictor=label, outcome=outcome)
+            metrics.inc("mentor_llm_prompt_tokens_total", prompt_tokens, help="Prompt tokens sent", predictor=label)
+            metrics.inc("mentor_llm_completion_tokens_total", completion_tokens, help="Completion tokens received", predictor=label)
+            if error is not None and "rate limit" in str(error).lower():
+                metrics.inc("mentor_llm_rate_limited_total", help="LM calls rejected by the provider rate limit", predictor=label)
+
+            span = dspy.settings.config.get("trace_span")
+            if span is not None:
+                span.add_call(seconds, prompt_tokens, completion_tokens, cache_hit, error is not None)
+            tracer.write({
+                "type": "llm", "predictor": label, "node": span.name if span else None, "started_at": started_at,
+                "duration_s": seconds, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "cache_hit": cache_hit, "coalesced": coalesced, "error": repr(error) if error else None,
+            })
+
+    def _usage(self, messages, prompt, outputs, cache_hit):
+        # real usage when the provider reported it for this exact request, otherwise a chars/4 estimate.
+        if not cache_hit and messages is not None:
+            for entry in reversed(self.base_lm.history[-16:]):
+                if entry.get("messages") is messages and entry.get("usage"):
+                    usage = entry["usage"]
+                    return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+        prompt_text = "\n".join(message["content"] for message in messages) if messages else (prompt or "")
+        return estimate_tokens(prompt_text), sum(estimate_tokens(str(output)) for output in outputs or [])
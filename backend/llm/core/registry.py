@@ -0,0 +1,82 @@
+import os
+import threading
+from functools import partial
+from llm.core.trainer.trainer_relevance_input import RelevanceDetector, load_trainset
+from llm.core.trainer.trainer_knowledge_master import KnowledgeMasterTrainer
+from llm.core.modules.relevance_module import RelevanceModule
+from llm.core.modules.knowledge_module import KnowledgeMaster
+from llm.core.observability import register_predictors
+from llm.core.relevance_router import RelevanceRouter
+
+class DetectorRegistry:
+    """
+    Process-wide home for the compiled detectors.
+    Building a detector loads its state file and compiles the module, so we do it once (ideally at startup
+    through warm_up) and every graph node afterwards only reads the reference.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._detectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+
+    def get(self, name):
+        # plain dict read on the hot path, only the first (cold) access takes the lock.
+        detector = self._detectors.get(name)
+        if detector is not None:
+            return detector
+
+        with self._lock:
+            if name not in self._detectors:
+                if name not in self._factories:
+                    raise KeyError(f"No detector registered under '{name}'")
+                self._detectors[name] = self._factories[name]()
+                if hasattr(self._detectors[name], "model"):
+                    register_predictors(self._detectors[name].model, name)
+            return self._detectors[name]
+
+    def warm_up(self, *names):
+        for name in names or list(self._factories):
+            print(f"Warming up detector '{name}'...")
+            self.get(name)
+
+    def swap(self, name, detector):
+        # reference assignment is atomic, in-flight calls keep using the detector they already hold.
+        if hasattr(detector, "model"):
+            register_predictors(detector.model, name)
+        with self._lock:
+            previous = self._detectors.get(name)
+            self._detectors[name] = detector
+        return previous
+
+    def reload(self, name):
+        # build the replacement outside the lock so readers are never blocked by a retrain.
+        detector = self._factories[name]()
+        return self.swap(name, detector)
+
+    def is_warm(self, name):
+        return name in self._detectors
+
+
+registry = DetectorRegistry()
+registry.register("relevance", lambda: RelevanceDetector(RelevanceModule))
+
+def build_relevance_router():
+    # a few hundred ms of fitting on the relevance trainset. Until calibration against the LLM's labels on the
+    # held-out set is done (in the background), only confident FALSE is answered locally.
+    router = RelevanceRouter(
+        load_trainset(),
+        threshold=float(os.environ.get("RELEVANCE_ROUTER_THRESHOLD", 0.9)),
+        shadow_rate=float(os.environ.get("RELEVANCE_ROUTER_SHADOW_RATE", 0.05)),
+        local_labels=tuple(os.environ.get("RELEVANCE_ROUTER_LOCAL", "FALSE").split(",")),
+    )
+    if os.environ.get("RELEVANCE_ROUTER_CALIBRATE", "1") == "1":
+        router.calibrate_in_background(lambda: registry.get("relevance"))
+    return router
+
+registry.register("relevance_router", build_relevance_router)
+registry.register("knowledge_master", lambda: KnowledgeMasterTrainer(partial(KnowledgeMaster, mode=os.environ.get("KNOWLEDGE_MASTER_MODE", "staged"))))
@@ -0,0 +1,209 @@
+import re
+import math
+import random
+import threading
+import dspy
+from llm.core.concurrency import get_executor, with_current_settings
+from llm.core.observability import metrics
+from llm.core.lm.scheduler import lm_lane
+
+# Strong signals either way. They are features of the linear model with a head start on their weights,
+# so the trainset can still overrule them, but a message that only trips one side is routed confidently.
+RELEVANT_RULES = [
+    r"\b(i|i'd|i'm|we) (want|would like|need|plan|hope|intend|am planning|am trying|aim)s? to\b",
+    r"\b(goals?|dream|aspir\w*|ambition|career|promotion|salary|degree|certification)\b",
+    r"\b(saving|save up|invest\w*|budget\w*|debt|retire\w*|down payment)\b",
+    r"\b(learn\w*|improv\w*|practic\w*|study\w*|skills?)\b",
+    r"\b(gym|workout|exercis\w*|diet|fitness|meditat\w*|therapy|sleep better)\b",
+    r"\b(feel\w*|stress\w*|anxious|overwhelm\w*|motivat\w*|tired|exhausted|low energy)\b",
+]
+IRRELEVANT_RULES = [
+    r"\bweather\b",
+    r"\b(watch(ed|ing)?|saw|seen) (a |the )?(movie|film|show|series|video|game)\b",
+    r"\bcat videos?\b",
+    r"\b(had|having|ate|eating) (lunch|dinner|breakfast|a snack)\b",
+    r"\b(groceries|grocery)\b",
+    r"^\s*(hi|hello|hey|thanks|thank you|ok|okay|lol)[\s!.]*$",
+]
+# a cheap guess at the category of a local TRUE, the LLM does better but it is informational only.
+CATEGORY_RULES = [
+    ("task", r"\b(need to|have to|must|deadline|by (monday|tuesday|wednesday|thursday|friday|tomorrow|tonight))\b"),
+    ("goal", r"\b(want to|plan to|goal|saving for|dream|hope to|next (week|month|year))\b"),
+    ("attribute", r"\b(i am an?|i'm an?|i prefer|i tend to|i usually)\b"),
+]
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def features(text):
+    text = (text or "").lower()
+    words = _WORD_RE.findall(text)
+    feats = {f"w:{word}" for word in words}
+    feats.update(f"b:{a}_{b}" for a, b in zip(words, words[1:]))
+    for i, rule in enumerate(RELEVANT_RULES):
+        if re.search(rule, text):
+            feats.add(f"rule:relevant:{i}")
+    for i, rule in enumerate(IRRELEVANT_RULES):
+        if re.search(rule, text):
+            feats.add(f"rule:irrelevant:{i}")
+    return feats
+
+
+class RelevanceRouter:
+    """
+    First stage in front of the LLM relevance classifier: a keyword/regex rule set plus a logistic regression
+    over words, bigrams and rule hits, trained from the relevance trainset (relevance_classifier_state.json).
+
+    route() answers locally when the model is at least as sure as the threshold of its answer and escalates
+    everything else to the LLM. Out of the box only FALSE has a threshold (`local_labels`): the rule priors make
+    "want to" / "feel" messages look confidently relevant, and a wrong local TRUE writes junk memories.
+    calibrate() sets per-answer thresholds from the LLM's labels on a held-out set instead.
+    A `shadow_rate` share of local answers is checked against the LLM in the background; the agreement rate
+    covers only those, escalated calls are uncertain by construction and counted apart.
+    """
+
+    def __init__(self, trainset, threshold=0.9, shadow_rate=0.05, local_labels=("FALSE",), epochs=150, learning_rate=0.5, l2=1e-3, rule_prior=2.5, seed=0):
+        # answer -> confidence needed to give it locally, None means always ask the LLM.
+        self.thresholds = {label: threshold if label in local_labels else None for label in ("TRUE", "FALSE")}
+        self.threshold = threshold  # calibration never goes below this
+        self.shadow_rate = shadow_rate
+        self.calibration = None
+        self.weights = {}
+        self.bias = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"local": 0, "llm": 0, "shadow_agree": 0, "shadow_disagree": 0, "escalated_agree": 0, "escalated_disagree": 0}
+        for i in range(len(RELEVANT_RULES)):
+            self.weights[f"rule:relevant:{i}"] = rule_prior / 2
+        for i in range(len(IRRELEVANT_RULES)):
+            self.weights[f"rule:irrelevant:{i}"] = -rule_prior
+        self.fit(trainset, epochs=epochs, learning_rate=learning_rate, l2=l2)
+
+    def fit(self, trainset, epochs=150, learning_rate=0.5, l2=1e-3):
+        data = [(features(example.input_text), 1.0 if str(example.relevance).upper() == "TRUE" else 0.0) for example in trainset]
+        for _ in range(epochs):
+            self._random.shuffle(data)
+            for feats, label in data:
+                error = self._probability(feats) - label
+                self.bias -= learning_rate * error
+                for feat in feats:
+                    weight = self.weights.get(feat, 0.0)
+                    self.weights[feat] = weight - learning_rate * (error + l2 * weight)
+
+    def _probability(self, feats):
+        score = self.bias + sum(self.weights.get(feat, 0.0) for feat in feats)
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, score))))
+
+    def predict(self, input_text):
+        """(relevance 'TRUE'/'FALSE', confidence in that answer, category guess)"""
+        probability = self._probability(features(input_text))
+        relevance = "TRUE" if probability >= 0.5 else "FALSE"
+        category = "irrelevant"
+        if relevance == "TRUE":
+            lowered = input_text.lower()
+            category = next((name for name, rule in CATEGORY_RULES if re.search(rule, lowered)), "journal")
+        return relevance, max(probability, 1.0 - probability), category
+
+    def route(self, input_text, classify):
+        """`classify(input_text)` is the LLM classifier (a Prediction with relevance/explanation/thoughts/category)."""
+        relevance, confidence, category = self.predict(input_text)
+        threshold = self.thresholds.get(relevance)
+
+        if threshold is not None and confidence >= threshold:
+            self._count("local")
+            if self.shadow_rate and self._random.random() < self.shadow_rate:
+                get_executor().submit(with_current_settings(self._shadow), input_text, classify, relevance)
+            return dspy.Prediction(
+                relevance=relevance,
+                category=category,
+                explanation=f"Classified locally with confidence {confidence:.2f}.",
+                thoughts="",
+                routed="local",
+                confidence=confidence,
+            )
+
+        self._count("llm")
+        prediction = classify(input_text)
+        self._compare(relevance, prediction.relevance, path="llm")
+        prediction.routed = "llm"
+        prediction.confidence = confidence
+        return prediction
+
+    def calibrate(self, examples, classify, target_agreement=0.97, min_support=10):
+        """
+        Per answer, the lowest confidence at which the local answers agree with the LLM on at least `target_agreement`
+        of the held-out `examples` (and at least `min_support` of them). An answer that never gets there goes to the LLM.
+        """
+        scored = {"TRUE": [], "FALSE": []}
+        for example in examples:
+            relevance, confidence, _ = self.predict(example.input_text)
+            llm = classify(example.input_text).relevance
+            scored[relevance].append((confidence, ("TRUE" in str(llm).upper()) == (relevance == "TRUE")))
+
+        thresholds, report = {}, {}
+        for label, rows in scored.items():
+            rows.sort(key=lambda row: -row[0])
+            best, agreed = None, 0
+            for n, (confidence, agree) in enumerate(rows, 1):
+                agreed += agree
+                if n >= min_support and agreed / n >= target_agreement:
+                    best = confidence
+            thresholds[label] = max(best, self.threshold) if best is not None else None
+            report[label] = {"threshold": thresholds[label], "examples": len(rows), "agreement": sum(agree for _, agree in rows) / len(rows) if rows else None}
+
+        with self._lock:
+            self.thresholds = thresholds
+            self.calibration = report
+        print(f"Relevance router calibrated on {sum(len(rows) for rows in scored.values())} held-out examples: {report}")
+        return report
+
+    def calibrate_in_background(self, get_detector):
+        """calibrate() against the relevance detector's held-out set on its own thread, routing stays FALSE-only meanwhile."""
+
+        def run():
+            try:
+                detector = get_detector()
+                classify = lambda text: detector.model(dspy.Example(input_text=text).with_inputs('input_text'))
+                with lm_lane("background"):
+                    self.calibrate(detector.valset, classify)
+            except Exception as e:
+                print(f"Relevance router calibration failed, only confident FALSE is answered locally: {e!r}")
+
+        thread = threading.Thread(target=run, name="relevance-router-calibration", daemon=True)
+        thread.start()
+        return thread
+
+    def _shadow(self, input_text, classify, relevance):
+        # off the request path, and not attributed to whichever graph node happened to trigger it.
+        try:
+            with dspy.settings.context(trace_span=None, lm_lane="background"):
+                prediction = classify(input_text)
+            self._compare(relevance, prediction.relevance, path="local")
+        except Exception as e:
+            print(f"Shadow relevance check failed: {e!r}")
+
+    def _count(self, path):
+        with self._lock:
+            self.counts[path] += 1
+        metrics.inc("mentor_relevance_router_total", help="Relevance decisions by where they were made", path=path)
+
+    def _compare(self, local, llm, path):
+        agree = "TRUE" in str(llm).upper() if local == "TRUE" else "TRUE" not in str(llm).upper()
+        prefix = "shadow" if path == "local" else "escalated"
+        with self._lock:
+            self.counts[f"{prefix}_{'agree' if agree else 'disagree'}"] += 1
+        metrics.inc("mentor_relevance_router_agreement_total", help="Local router vs LLM relevance on compared messages", path=path, agree=str(agree).lower())
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+            thresholds = dict(self.thresholds)
+        routed = counts["local"] + counts["llm"]
+        shadowed = counts["shadow_agree"] + counts["shadow_disagree"]
+        escalated = counts["escalated_agree"] + counts["escalated_disagree"]
+        return {
+            **counts,
+            "thresholds": thresholds,
+            "local_share": counts["local"] / routed if routed else 0.0,
+            # how often a local answer matches the LLM, the number that matters for routing.
+            "agreement_rate": counts["shadow_agree"] / shadowed if shadowed else 0.0,
+            "escalated_agreement_rate": counts["escalated_agree"] / escalated if escalated else 0.0,
+        }
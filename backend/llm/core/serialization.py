@@ -0,0 +1,23 @@
+from enum import Enum
+from uuid import UUID
+from pydantic import BaseModel
+
+def to_jsonable(value):
+    """Recursively turn dspy Examples, pydantic models, enums and UUIDs into plain JSON types."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, UUID):
+        return str(value)
+    if hasattr(value, "toDict"):
+        return to_jsonable(value.toDict())
+    if hasattr(value, "to_dict"):
+        return to_jsonable(value.to_dict())
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
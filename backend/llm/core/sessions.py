@@ -0,0 +1,152 @@
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from llm.core.memory.store import MemoryStore
+from llm.core.memory.ops import MemoryAudit, apply_op
+
+DEFAULT_SESSION = "local"
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class Session:
+    def __init__(self, session_id, memory, audit=None):
+        self.session_id = session_id
+        self.memory = memory
+        self.audit = audit
+        # a Speculation started by one node of the current turn for a later one.
+        self.speculation = None
+        self.messages = []
+        # one turn at a time per session, turns of different sessions never wait on each other.
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def apply_ops(self, ops, **context):
+        """Apply memory ops in order and record each one in the audit trail. Returns the ones that took effect."""
+        applied = []
+        for op in ops:
+            ok = apply_op(self.memory, op)
+            if self.audit is not None:
+                self.audit.record(op, ok, session_id=self.session_id, **context)
+            if ok:
+                applied.append(op)
+        return applied
+
+    def applied_job(self, job_id):
+        """Whether ops of this write-behind job already made it into the audit trail (the job is being replayed)."""
+        if self.audit is None:
+            return False
+        return any(record.get("job_id") == job_id for record in self.audit.read())
+
+    def close(self):
+        self.memory.close()
+        if self.audit is not None:
+            self.audit.close()
+
+
+class SessionManager:
+    """
+    Keeps one Session (memory store + message history) per user.
+    The manager lock only guards the session table; graph runs hold the lock of their own session.
+    Every session's memory lives in its own MemoryStore file, so evicting an idle session only closes
+    file handles and the next request for it reopens the same memories.
+    """
+
+    def __init__(self, directory="sessions", idle_timeout=30 * 60):
+        self.directory = directory
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._loading = {}  # session_id -> Event set once the session being opened is published (or failed)
+        self._lock = threading.Lock()
+        self._eviction_thread = None
+
+    def get(self, session_id):
+        if not _SESSION_ID_RE.match(session_id or ""):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+
+        while True:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    session.touch()
+                    return session
+                loading = self._loading.get(session_id)
+                owner = loading is None
+                if owner:
+                    loading = self._loading[session_id] = threading.Event()
+            if not owner:
+                # someone else is opening it, look again once they're done (or failed).
+                loading.wait()
+                continue
+
+            try:
+                # replaying a big log takes a while, so it happens outside the manager lock.
+                session = self._open(session_id)
+                with self._lock:
+                    self._sessions[session_id] = session
+                return session
+            finally:
+                with self._lock:
+                    del self._loading[session_id]
+                loading.set()
+
+    def _open(self, session_id):
+        memory = MemoryStore(os.path.join(self.directory, f"{session_id}.jsonl"))
+        audit = MemoryAudit(os.path.join(self.directory, f"{session_id}.audit.jsonl"))
+        return Session(session_id, memory, audit)
+
+    @contextmanager
+    def acquire(self, session_id):
+        while True:
+            session = self.get(session_id)
+            with session.lock:
+                # evicted between get() and taking the lock, pick up the fresh one.
+                if self._sessions.get(session_id) is not session:
+                    continue
+                session.touch()
+                yield session
+                session.touch()
+                return
+
+    def evict_idle(self):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if now - session.last_used < self.idle_timeout:
+                    continue
+                # a session in the middle of a turn is never idle, skip it instead of waiting.
+                if not session.lock.acquire(blocking=False):
+                    continue
+                try:
+                    del self._sessions[session_id]
+                    session.close()
+                    evicted.append(session_id)
+                finally:
+                    session.lock.release()
+        return evicted
+
+    def start_eviction(self, interval=60):
+        def loop():
+            while True:
+                time.sleep(interval)
+                evicted = self.evict_idle()
+                if evicted:
+                    print(f"Evicted idle sessions: {evicted}")
+
+        self._eviction_thread = threading.Thread(target=loop, daemon=True)
+        self._eviction_thread.start()
+
+    def close_all(self):
+        # never wait on a session lock while holding the manager lock: a node holding its session calls get().
+        with self._lock:
+            closing, self._sessions = list(self._sessions.values()), {}
+        for session in closing:
+            with session.lock:
+                session.close()
+
+    def __len__(self):
+        return len(self._sessions)
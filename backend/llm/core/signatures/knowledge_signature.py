@@ -4,6 +4,8 @@ from enum import Enum
 from pydantic import BaseModel, Field
 from uuid import UUID, uuid4
 
+CATEGORIES = ["ShortTermGoals", "MediumTermGoals", "LongTermGoals", "Task", "JournalEntry", "UserAttribute"]
+
 class StatusEntry(str, Enum):
     CreateMemory = "CreateMemory"
     DeleteMemory = "DeleteMemory"
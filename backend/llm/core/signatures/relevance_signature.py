@@ -21,4 +21,14 @@ class RelevanceClassifier(dspy.Signature):
     category = dspy.OutputField(desc="Category for each the relevant input is identified as: 'goal', 'task', 'journal', 'attribute', or 'irrelevant'")
     thoughts = dspy.OutputField(desc="Step-by-step reasoning about the relevance of the input, considering the broader context of personal development and life goals")
     relevance = dspy.OutputField(desc="TRUE if relevant to any aspect of personal development or life goals (interpreted broadly), FALSE otherwise")
-    explanation = dspy.OutputField(desc="Brief explanation for the classification, including any inferred relevance to personal development or life goals")
\ No newline at end of file
+    explanation = dspy.OutputField(desc="Brief explanation for the classification, including any inferred relevance to personal development or life goals")
+
+class BatchRelevanceClassifier(dspy.Signature):
+    """Classify each numbered input, independently of the others, for relevance to personal development, goals, or life aspirations.
+
+    Interpret relevance as broadly as for a single input: personal growth, skills, career, finances,
+    health, relationships, material acquisitions that signal life changes, and implied aspirations all count.
+    Return exactly one classification per input, using the input's index.
+    """
+    inputs = dspy.InputField(desc="JSON list of objects with 'index' and 'text'")
+    classifications = dspy.OutputField(desc="JSON list with one object per input: {\"index\": int, \"relevance\": \"TRUE\" or \"FALSE\", \"category\": 'goal', 'task', 'journal', 'attribute' or 'irrelevant', \"explanation\": one short sentence}")
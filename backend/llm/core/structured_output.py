@@ -0,0 +1,168 @@
+import re
+import ast
+import json
+import logging
+from pydantic import BaseModel, ValidationError
+from llm.core.observability import metrics
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"```(?:json|python)?\s*(.*?)(?:```|$)", re.S)
+_CLOSERS = {"[": "]", "{": "}"}
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+class StructuredOutputError(ValueError):
+    """Nothing usable could be recovered from an LM output."""
+
+def _strip_wrapping(text):
+    # code fences and chatter before/after the payload.
+    fenced = _FENCE_RE.search(text)
+    if fenced and fenced.group(1).strip():
+        text = fenced.group(1)
+    starts = [i for i in (text.find("["), text.find("{")) if i >= 0]
+    return text[min(starts):].strip() if starts else text.strip()
+
+_VALUE_START_RE = re.compile(r"""["'{\[\]}\-\d]|(True|False|None|true|false|null)\b""")
+
+def _closes_single_quote(text, i):
+    # a ' only ends a single-quoted string when structure follows it, otherwise it's an apostrophe (I'm, user's).
+    rest = text[i + 1:].lstrip()
+    if not rest or rest[0] in ":}]":
+        return True
+    # after a comma the next value has to start, "'hi', ok" is still inside the string.
+    return rest[0] == "," and (not rest[1:].strip() or bool(_VALUE_START_RE.match(rest[1:].lstrip())))
+
+def _normalize(text):
+    """
+    One pass over Python-literal or JSON-ish text producing JSON: single-quoted strings become double-quoted,
+    True/False/None become JSON literals, trailing commas go away. Returns the normalized text, the bracket stack
+    still open at the end (a string still open counts too), and the cut points (offset, stack) before each comma
+    that separates elements of the outermost container, for truncated output.
+    """
+    out, stack, cuts = [], [], []
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\" and i + 1 < len(text):
+                escaped = text[i + 1]
+                # \' is valid Python but not JSON.
+                out.append("'" if escaped == "'" else char + escaped)
+                i += 2
+                continue
+            if char == quote and (quote == '"' or _closes_single_quote(text, i)):
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in _CLOSERS:
+            stack.append(char)
+            out.append(char)
+        elif char in "]}":
+            while out and out[-1] in " \n\t":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            if len(stack) == 1:
+                # an element of the outermost container just completed.
+                cuts.append((len(out), list(stack)))
+            elif not stack:
+                # the payload is complete, whatever follows is chatter.
+                break
+        elif char == ",":
+            if len(stack) == 1:
+                cuts.append((len(out), list(stack)))
+            out.append(char)
+        elif char.isalpha():
+            word = re.match(r"\w+", text[i:]).group(0)
+            out.append(_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    if quote:
+        out.append('"')
+        stack.append(quote)
+    return "".join(out), stack, cuts
+
+def _close(text, stack):
+    return text.rstrip().rstrip(",") + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+def parse_structured(value):
+    """
+    Best-effort decode of a JSON / Python-literal LM output into Python data.
+    Returns (data, repaired) where repaired says whether anything beyond a plain json.loads was needed.
+    Truncated output (a string or bracket still open at the end) keeps only the elements of the outermost
+    container that were complete; the cut-off one is dropped rather than closed into a made-up item.
+    """
+    if not isinstance(value, str):
+        return value, False
+
+    text = _strip_wrapping(value)
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(text), True
+    except (ValueError, SyntaxError):
+        pass
+
+    normalized, stack, cuts = _normalize(text)
+    if stack:
+        # truncated mid-element: everything up to the last complete one, newest cut first.
+        candidates = [_close(normalized[:offset], cut_stack) for offset, cut_stack in reversed(cuts[-8:])]
+    else:
+        candidates = [normalized]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            continue
+    raise StructuredOutputError(f"Could not parse structured output: {value[:200]!r}")
+
+def parse_model_list(value, model, field="output"):
+    """
+    Parse an LM output that should be a list of `model` objects (a single object is accepted too).
+    Items that don't validate are dropped. Outcomes are counted per field in /metrics:
+    ok, repaired, partial (some items dropped) and failed (nothing usable, returns []).
+    """
+    try:
+        data, repaired = parse_structured(value)
+    except StructuredOutputError as e:
+        logger.warning("%s: %s", field, e)
+        metrics.inc("mentor_structured_output_parses_total", help="Structured LM output parses by outcome", field=field, outcome="failed")
+        return []
+
+    items = [data] if isinstance(data, dict) else data if isinstance(data, list) else []
+    parsed = []
+    for item in items:
+        try:
+            parsed.append(item if isinstance(item, BaseModel) else model.model_validate(item))
+        except ValidationError as e:
+            logger.warning("%s: dropping invalid item %r: %s", field, item, e)
+
+    if items and not parsed:
+        outcome = "failed"
+    elif len(parsed) < len(items):
+        outcome = "partial"
+    else:
+        outcome = "repaired" if repaired else "ok"
+    metrics.inc("mentor_structured_output_parses_total", help="Structured LM output parses by outcome", field=field, outcome=outcome)
+    return parsed
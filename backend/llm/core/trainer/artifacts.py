@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+import dspy
+from llm.core.serialization import to_jsonable
+
+# Bump this whenever the layout of the artifact file changes.
+ARTIFACT_VERSION = 1
+
+class ArtifactMismatchError(Exception):
+    """The artifact on disk was produced by a different format version or a different set of signatures."""
+
+def _signature_fingerprint(signature):
+    fields = []
+    for name, field in signature.fields.items():
+        extra = getattr(field, "json_schema_extra", None) or {}
+        fields.append([name, extra.get("__dspy_field_type"), extra.get("desc"), extra.get("prefix")])
+    return {"instructions": signature.instructions, "fields": fields}
+
+def _hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def predictor_signature_hash(predictor):
+    return _hash(_signature_fingerprint(predictor.signature))
+
+def signature_hash(module):
+    """Content hash over every predictor's signature: instructions, field names, types and descriptions."""
+    return _hash([[name, _signature_fingerprint(predictor.signature)] for name, predictor in module.named_predictors()])
+
+def record_trace_demos(module, trace, name2demos):
+    """Turn a successful dspy trace into per-predictor demos, the same way BootstrapFewShot does."""
+    predictor2name = {id(predictor): name for name, predictor in module.named_predictors()}
+    for predictor, inputs, outputs in trace:
+        name = predictor2name.get(id(predictor))
+        if name is None:
+            continue
+        name2demos.setdefault(name, []).append(dspy.Example(augmented=True, **inputs, **outputs))
+
+def install_demos(module, name2demos, max_demos):
+    for name, predictor in module.named_predictors():
+        predictor.demos = name2demos.get(name, [])[:max_demos]
+    return module
+
+def save_compiled_program(module, filepath):
+    artifact = {
+        "artifact_version": ARTIFACT_VERSION,
+        "model_class": module.__class__.__name__,
+        "signature_hash": signature_hash(module),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "predictors": {
+            name: {
+                "signature_hash": predictor_signature_hash(predictor),
+                "demos": [to_jsonable(demo) for demo in predictor.demos],
+            }
+            for name, predictor in module.named_predictors()
+        },
+    }
+
+    # write to a temp file first so a crash never leaves a half written artifact behind.
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, 'w') as f:
+        json.dump(artifact, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filepath, filepath)
+    print(f"Compiled program saved to {filepath}")
+
+def load_compiled_program(module_class, filepath):
+    """Rebuild a compiled module from its artifact. Pure file read, no LLM calls."""
+    with open(filepath, 'r') as f:
+        artifact = json.load(f)
+
+    if artifact.get("artifact_version") != ARTIFACT_VERSION:
+        raise ArtifactMismatchError(f"artifact version {artifact.get('artifact_version')} != {ARTIFACT_VERSION}")
+
+    module = module_class()
+    if artifact.get("model_class") != module.__class__.__name__:
+        raise ArtifactMismatchError(f"artifact was compiled for {artifact.get('model_class')}")
+    if artifact.get("signature_hash") != signature_hash(module):
+        raise ArtifactMismatchError("signatures changed since the artifact was compiled")
+
+    for name, predictor in module.named_predictors():
+        predictor_state = artifact["predictors"].get(name, {"demos": []})
+        predictor.demos = [dspy.Example(**demo) for demo in predictor_state["demos"]]
+
+    return module
@@ -0,0 +1,66 @@
+import os
+import time
+import statistics
+import dspy
+from llm.core.modules.knowledge_module import KnowledgeMaster
+from llm.core.serialization import to_jsonable
+from llm.core.trainer.handcraft_examples import handcrafted_examples
+from llm.core.trainer.trainer_knowledge_master import validate_knowledge_master
+
+def _usage_since(lm, start):
+    calls = lm.history[start:]
+    tokens = sum((call.get("usage") or {}).get("total_tokens", 0) or 0 for call in calls)
+    return len(calls), tokens
+
+def benchmark_mode(lm, mode, examples):
+    module = KnowledgeMaster(mode=mode, concurrent=False)
+    latencies, calls, tokens = [], [], []
+    correct, correct_status, fallbacks = 0, 0, 0
+
+    for example in examples:
+        # the handcrafted entries are pydantic objects, the graph always hands the module plain dicts.
+        existing_knowledge = to_jsonable(example.existing_knowledge)
+        start = len(lm.history)
+        started_at = time.perf_counter()
+        pred = module(input_text=example.input_text, existing_knowledge=existing_knowledge)
+        latencies.append(time.perf_counter() - started_at)
+
+        example_calls, example_tokens = _usage_since(lm, start)
+        calls.append(example_calls)
+        tokens.append(example_tokens)
+
+        if pred is None:
+            continue
+        if pred["context"]["mode"] != mode:
+            fallbacks += 1
+        if validate_knowledge_master(example, pred):
+            correct += 1
+        if pred["output"].status == example.output.status:
+            correct_status += 1
+
+    return {
+        "mode": mode,
+        "examples": len(examples),
+        "p50_latency_s": statistics.median(latencies),
+        "max_latency_s": max(latencies),
+        "avg_llm_calls": statistics.mean(calls),
+        "avg_tokens": statistics.mean(tokens),
+        "accuracy": correct / len(examples),
+        "status_accuracy": correct_status / len(examples),
+        "fallbacks": fallbacks,
+    }
+
+if __name__ == "__main__":
+    GROQ_API_KEY = os.environ['GROQ_API_KEY']
+    # the provider cache would make the second mode look free.
+    groq = dspy.LM('groq/llama3-70b-8192', api_key=GROQ_API_KEY, max_tokens=500, cache=False)
+    dspy.settings.configure(lm=groq)
+
+    for mode in ["staged", "fused"]:
+        result = benchmark_mode(groq, mode, handcrafted_examples)
+        print(
+            f"{result['mode']:>6}: p50 {result['p50_latency_s']:.2f}s, max {result['max_latency_s']:.2f}s, "
+            f"{result['avg_llm_calls']:.1f} calls, {result['avg_tokens']:.0f} tokens, "
+            f"accuracy {result['accuracy']:.2f}, status accuracy {result['status_accuracy']:.2f}, "
+            f"fallbacks {result['fallbacks']}/{result['examples']}"
+        )
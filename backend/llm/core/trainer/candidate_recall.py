@@ -0,0 +1,35 @@
+from llm.core.memory.retrieval import CandidateRetriever
+from llm.core.trainer.handcraft_examples import handcrafted_examples
+
+def build_memory_pool(examples):
+    # every existing entry across the handcrafted set becomes one shared memory, so each example has to
+    # find its original entry among all the others.
+    pool = {}
+    for example in examples:
+        for entry in example.existing_knowledge:
+            if entry.id is not None:
+                pool[str(entry.id)] = entry
+    return list(pool.values())
+
+def candidate_recall(examples, k, retriever=None):
+    """recall@k of the pre-filter: share of update/delete examples whose original entry survives the shortlist."""
+    retriever = retriever or CandidateRetriever(k=k)
+    pool = build_memory_pool(examples)
+    hits, total = 0, 0
+
+    for example in examples:
+        original_entry = example.output.original_entry
+        if original_entry is None or getattr(original_entry, "id", None) is None:
+            continue
+        total += 1
+        # offline we don't have the analyze stage, the labelled output is the closest stand-in for it.
+        candidates = retriever.select(query=f"{example.input_text} {example.output.content}", entries=pool, category=example.output.category, k=k)
+        if str(original_entry.id) in {str(entry.id) for entry in candidates}:
+            hits += 1
+
+    return hits / total if total else 1.0, total, len(pool)
+
+if __name__ == "__main__":
+    for k in [1, 3, 5, 8]:
+        recall, total, pool_size = candidate_recall(handcrafted_examples, k)
+        print(f"recall@{k}: {recall:.2f} ({total} update/delete examples, {pool_size} memories)")
@@ -0,0 +1,90 @@
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+from llm.core.concurrency import with_current_settings
+
+class ItemResult:
+    __slots__ = ("index", "value", "error", "seconds", "timed_out")
+
+    def __init__(self, index, value=None, error=None, seconds=0.0, timed_out=False):
+        self.index = index
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.error is None and not self.timed_out
+
+
+class ParallelEvaluator:
+    """
+    Runs one call per example on a bounded pool and hands the results back in input order.
+
+    A call that runs longer than `timeout` seconds is reported as timed out and no longer waited on.
+    Python threads can't be killed, so it keeps its worker until the LLM call returns; the pool is
+    sized for that and is dropped without waiting at the end of the run.
+    """
+
+    def __init__(self, num_workers=8, timeout=120, show_progress=True):
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.show_progress = show_progress
+        self.last_stats = {}
+
+    def run(self, fn, items, desc="Evaluating"):
+        results = [None] * len(items)
+        started_at = {}
+        wall_start = time.perf_counter()
+
+        def timed(index, item):
+            started_at[index] = time.perf_counter()
+            try:
+                return ItemResult(index, value=fn(item), seconds=time.perf_counter() - started_at[index])
+            except Exception as e:
+                return ItemResult(index, error=e, seconds=time.perf_counter() - started_at[index])
+
+        executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="evaluator")
+        progress = tqdm(total=len(items), desc=desc, disable=not self.show_progress)
+        try:
+            pending = {executor.submit(with_current_settings(timed), index, item): index for index, item in enumerate(items)}
+            while pending:
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+                    progress.update(1)
+
+                now = time.perf_counter()
+                for future, index in list(pending.items()):
+                    if index in started_at and now - started_at[index] > self.timeout:
+                        del pending[future]
+                        results[index] = ItemResult(index, seconds=now - started_at[index], timed_out=True)
+                        progress.update(1)
+        finally:
+            progress.close()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        self.last_stats = self._stats(results, time.perf_counter() - wall_start)
+        return results
+
+    def _stats(self, results, wall_time):
+        latencies = sorted(result.seconds for result in results if result.ok)
+        return {
+            "examples": len(results),
+            "errors": sum(1 for result in results if result.error is not None),
+            "timeouts": sum(1 for result in results if result.timed_out),
+            "wall_time_s": wall_time,
+            "throughput_per_s": len(results) / wall_time if wall_time else 0.0,
+            "p50_latency_s": statistics.median(latencies) if latencies else 0.0,
+            "p95_latency_s": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        }
+
+    def print_stats(self):
+        stats = self.last_stats
+        print(
+            f"{stats['examples']} examples in {stats['wall_time_s']:.1f}s ({stats['throughput_per_s']:.2f}/s), "
+            f"p50 {stats['p50_latency_s']:.2f}s, p95 {stats['p95_latency_s']:.2f}s, "
+            f"{stats['errors']} errors, {stats['timeouts']} timeouts"
+        )
@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from llm.core.lm.cache import cache_bypass
+from llm.core.lm.scheduler import lm_lane
+from llm.core.trainer.artifacts import save_compiled_program
+
+VERSIONS_DIR = "local_cache/versions"
+
+class ModelVersion:
+    __slots__ = ("version", "model", "trainset", "accuracy", "created_at")
+
+    def __init__(self, version, model, trainset, accuracy=None):
+        self.version = version
+        self.model = model
+        self.trainset = trainset
+        self.accuracy = accuracy
+        self.created_at = time.time()
+
+
+class VersionedModel:
+    """
+    The live compiled program behind a single reference. Readers take `current` without any lock and keep
+    the version they got for the whole request; promote/rollback replace the reference in one assignment.
+    The version it replaced is kept around so a bad promotion can be undone without recompiling.
+    """
+
+    def __init__(self, model, trainset, accuracy=None):
+        self.current = ModelVersion(1, model, trainset, accuracy)
+        self.previous = None
+        self._lock = threading.Lock()  # writers only
+
+    def promote(self, model, trainset, accuracy=None):
+        with self._lock:
+            version = ModelVersion(self.current.version + 1, model, trainset, accuracy)
+            self.previous, self.current = self.current, version
+            return version
+
+    def rollback(self):
+        with self._lock:
+            if self.previous is None:
+                raise RuntimeError("No previous version to roll back to")
+            self.previous, self.current = self.current, self.previous
+            return self.current
+
+
+class RetrainingService:
+    """
+    Rebuilds detectors in the background and swaps them in only when they hold up on the held-out set.
+
+    A detector needs `versions` (VersionedModel), `build_candidate()` -> (model, trainset), `score(model)` -> accuracy
+    on its held-out set, and `program_filepath`. Compiling and scoring happen on this thread; the serving path only
+    ever sees the reference change. A candidate scoring more than `tolerance` below the live version is dropped.
+    """
+
+    def __init__(self, detectors, interval=86400, tolerance=0.0, versions_dir=VERSIONS_DIR):
+        self.detectors = detectors  # name -> detector
+        self.interval = interval
+        self.tolerance = tolerance
+        self.versions_dir = versions_dir
+        self.history = []  # one dict per retraining attempt
+        self._stop = threading.Event()
+        self._thread = None
+
+    def retrain(self, name):
+        # compile and scoring calls queue behind user traffic (and pause while it is slow).
+        with lm_lane("training"):
+            return self._retrain(name)
+
+    def _retrain(self, name):
+        detector = self.detectors[name]
+        live = detector.versions.current
+
+        print(f"Retraining '{name}' (live version {live.version})...")
+        # retraining should see what the model answers today, not yesterday's cached responses.
+        with cache_bypass():
+            model, trainset = detector.build_candidate()
+        accuracy = detector.score(model)
+        if live.accuracy is None:
+            live.accuracy = detector.score(live.model)
+
+        attempt = {"detector": name, "live_version": live.version, "live_accuracy": live.accuracy, "candidate_accuracy": accuracy, "at": time.time()}
+        if accuracy + self.tolerance < live.accuracy:
+            print(f"Candidate for '{name}' regressed ({accuracy:.2f} < {live.accuracy:.2f}), keeping version {live.version}.")
+            self.history.append({**attempt, "promoted": False})
+            return None
+
+        version = detector.versions.promote(model, trainset, accuracy)
+        self._persist(name, detector, version)
+        print(f"Promoted '{name}' version {version.version} ({live.accuracy:.2f} -> {accuracy:.2f}).")
+        self.history.append({**attempt, "promoted": True, "version": version.version})
+        return version
+
+    def rollback(self, name):
+        detector = self.detectors[name]
+        version = detector.versions.rollback()
+        # the next restart should come back on the version we rolled back to.
+        save_compiled_program(version.model, detector.program_filepath)
+        print(f"Rolled '{name}' back to version {version.version}.")
+        return version
+
+    def _persist(self, name, detector, version):
+        os.makedirs(self.versions_dir, exist_ok=True)
+        save_compiled_program(version.model, os.path.join(self.versions_dir, f"{name}_v{version.version}.json"))
+        save_compiled_program(version.model, detector.program_filepath)
+
+    def run_forever(self):
+        while not self._stop.wait(self.interval):
+            for name in self.detectors:
+                try:
+                    self.retrain(name)
+                except Exception as e:
+                    print(f"Retraining '{name}' failed, keeping the live version: {e!r}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="retraining", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
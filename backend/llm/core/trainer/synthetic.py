@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+from llm.core.concurrency import with_current_settings
+from llm.core.lm.cache import cache_bypass
+from llm.core.lm.rate_limit import call_with_backoff
+from llm.core.lm.scheduler import lm_lane
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def _words(message):
+    return frozenset(_WORD_RE.findall((message or "").lower()))
+
+def is_near_duplicate(words, accepted, threshold):
+    for other in accepted:
+        union = len(words | other)
+        if union and len(words & other) / union >= threshold:
+            return True
+    return False
+
+def _read_progress(output_path):
+    plan, results = None, {}
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # last line torn by an interrupted run, that job simply runs again.
+                continue
+            if record["type"] == "plan":
+                plan = record["jobs"]
+            else:
+                results[record["index"]] = record["message"]
+    return plan, results
+
+def generate_concurrently(generate_one, jobs, workers=8, output_path=None, keep_output=False, similarity_threshold=0.85, desc="Generating synthetic data"):
+    """
+    Run `generate_one(job) -> message` for every job on a thread pool and return [(job, message)] in job order.
+
+    - the calls run in the "training" lane of the LM scheduler, which holds the RPM/TPM budget for the whole
+      process; a 429 that gets through anyway is retried with backoff.
+    - with `output_path`, the job plan and each finished message are appended to a JSONL file, so an
+      interrupted build picks up where it stopped instead of paying for the finished calls again. A file
+      planned for a different number of jobs is started over. Once the build finishes the file is removed,
+      unless `keep_output` (the holdout set, which is meant to stay the same across runs).
+    - near-identical messages (word Jaccard >= similarity_threshold) are dropped, keeping the first one.
+    - synthetic data wants fresh samples, so these calls skip the response cache.
+    """
+    results = {}
+    if output_path and os.path.exists(output_path):
+        plan, results = _read_progress(output_path)
+        if plan is not None and len(plan) == len(jobs):
+            jobs = plan
+            print(f"Resuming synthetic data from {output_path}: {len(results)}/{len(jobs)} done")
+        else:
+            print(f"{output_path} was planned for {len(plan or [])} samples, not {len(jobs)}, starting over")
+            os.remove(output_path)
+            results = {}
+
+    output_file = None
+    write_lock = threading.Lock()
+    if output_path:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        is_new = not os.path.exists(output_path)
+        output_file = open(output_path, 'a')
+        if is_new:
+            output_file.write(json.dumps({"type": "plan", "jobs": jobs}) + "\n")
+            output_file.flush()
+
+    def run(index):
+        job = jobs[index]
+
+        def call():
+            with cache_bypass(), lm_lane("training"):
+                return generate_one(job)
+
+        message = call_with_backoff(call)
+        if output_file:
+            with write_lock:
+                output_file.write(json.dumps({"type": "result", "index": index, "message": message}) + "\n")
+                output_file.flush()
+        return index, message
+
+    pending = [index for index in range(len(jobs)) if index not in results]
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(with_current_settings(run), index) for index in pending]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                index, message = future.result()
+                results[index] = message
+    finally:
+        if output_file:
+            output_file.close()
+    # only reached when every job finished, an interrupted build keeps its file to resume from.
+    if output_path and not keep_output:
+        os.remove(output_path)
+
+    accepted, accepted_words, duplicates = [], [], 0
+    for index in range(len(jobs)):
+        words = _words(results[index])
+        if is_near_duplicate(words, accepted_words, similarity_threshold):
+            duplicates += 1
+            continue
+        accepted_words.append(words)
+        accepted.append((jobs[index], results[index]))
+
+    if duplicates:
+        print(f"Dropped {duplicates} near-duplicate synthetic messages")
+    return accepted
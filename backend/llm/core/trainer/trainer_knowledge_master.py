@@ -4,10 +4,18 @@ from dspy.teleprompt import BootstrapFewShot
 import json
 import random
 from tqdm import tqdm
-from functools import lru_cache
 from uuid import uuid4
 from llm.core.signatures.knowledge_signature import KnowledgeMasterOutput, Entry, StatusEntry
 from llm.core.trainer.handcraft_examples import handcrafted_examples
+from llm.core.trainer.synthetic import generate_concurrently
+from llm.core.trainer.parallel_eval import ParallelEvaluator
+from llm.core.trainer.retraining import VersionedModel, RetrainingService
+from llm.core.lm.scheduler import lm_lane
+from llm.core.trainer.artifacts import ArtifactMismatchError, load_compiled_program, save_compiled_program, record_trace_demos, install_demos
+
+STATE_FILEPATH = "knowledge_master_state.json"
+PROGRAM_FILEPATH = "knowledge_master_program.json"
+HOLDOUT_FILEPATH = "local_cache/knowledge_master_holdout.jsonl"
 
 
 class SyntheticMessageGenerator(dspy.Signature):
@@ -23,8 +31,7 @@ class SyntheticMessageGenerator(dspy.Signature):
 # delete entry scenarios -> status and input_text should reflect the intent
 # delete detail entry scenarios -> status and input_text should reflect the intent
 
-@lru_cache(maxsize=1)
-def generate_synthetic_data(num_samples=10):
+def generate_synthetic_data(num_samples=10, workers=8, output_path=None, keep_output=False):
     generator = dspy.Predict(SyntheticMessageGenerator)
     synthetic_data = []
     categories = ['ShortTermGoals', 'MediumTermGoals', 'LongTermGoals', 'Task', 'JournalEntry', 'UserAttribute']
@@ -36,18 +43,21 @@ def generate_synthetic_data(num_samples=10):
         "hobbies and interests", "spirituality", "work-life balance"
     ]
 
-    for _ in tqdm(range(num_samples), desc="Generating synthetic data"):
+    jobs = [{"category": random.choices(categories, weights=categories_weights, k=1)[0], "context": random.choice(contexts)} for _ in range(num_samples)]
+    # some temperature so repeated (category, context) pairs don't all come back as the same message.
+    generate_one = lambda job: generator(category=job["category"], context=job["context"], config=dict(temperature=0.9)).message
+
+    for job, message in generate_concurrently(generate_one, jobs, workers=workers, output_path=output_path, keep_output=keep_output):
         new_id = uuid4()
-        category = random.choices(categories, weights=categories_weights, k=1)[0]
-        context = random.choice(contexts)
-        result = generator(category=category, context=context)
+        category = job["category"]
+        context = job["context"]
         example = dspy.Example(
-            input_text=result.message,
+            input_text=message,
             existing_knowledge=[Entry()],  # Empty list for simplicity
             output=KnowledgeMasterOutput(
                 id=new_id,
                 category=category,
-                content=result.message,
+                content=message,
                 details=[{"reason": context}],
                 status=StatusEntry("CreateMemory"),
                 original_entry=Entry(id=None, category=None, content=None, details=None, status=None, to_remove=[])
@@ -66,11 +76,13 @@ def validate_knowledge_master(example, pred, trace=None):
     return correct_category and correct_content
 
 class CustomBootstrapFewShot(BootstrapFewShot):
-    def __init__(self, metric):
+    def __init__(self, metric, num_workers=8, timeout=120):
         super().__init__(metric)
         self.successful_examples = []
         self.failed_examples = []
         self.bootstrapped_examples = []
+        self.name2demos = {}
+        self.evaluator = ParallelEvaluator(num_workers=num_workers, timeout=timeout)
 
     def compile(self, module, trainset, valset=None, max_rounds=1, max_traces=1, **config):
         print(f"Starting compilation with {len(trainset)} total examples")
@@ -81,17 +93,17 @@ class CustomBootstrapFewShot(BootstrapFewShot):
 
         for round in range(max_rounds):
             print(f"Starting round {round + 1}")
-            traces_this_round = 0
-            for _ in tqdm(range(max_traces), desc=f"Round {round + 1} traces"):
-                if not self.bootstrapped_examples:
-                    break
-                self.step(module)
-                traces_this_round += 1
-
-            print(f"Completed {traces_this_round} traces in round {round + 1}")
-            if traces_this_round == 0:
+            batch = self.bootstrapped_examples[:max_traces]
+            del self.bootstrapped_examples[:max_traces]
+            if batch:
+                self._bootstrap_batch(module, batch, desc=f"Round {round + 1} traces")
+
+            print(f"Completed {len(batch)} traces in round {round + 1}")
+            if len(batch) == 0:
                 break
 
+        install_demos(module, self.name2demos, self.max_bootstrapped_demos)
+
         # Evaluate on valset if provided
         if valset:
             accuracy = self.evaluate(module, valset)
@@ -106,28 +118,40 @@ class CustomBootstrapFewShot(BootstrapFewShot):
         else:
             print("No more examples to bootstrap.")
 
-    def _bootstrap_one_example(self, module, example):
-        input_text = example.input_text
-        existing_knowledge = example.existing_knowledge
+    def _predict(self, module, example):
+        return module(example.input_text, example.existing_knowledge)
 
-        pred = module(input_text, existing_knowledge)
+    def _traced_predict(self, module, example):
+        # trace is a thread-local setting, so every worker collects only its own example's trace.
+        with dspy.settings.context(trace=[]):
+            pred = self._predict(module, example)
+            return pred, dspy.settings.trace
 
-        if self.metric(example, pred):
+    def _bootstrap_batch(self, module, batch, desc):
+        results = self.evaluator.run(lambda example: self._traced_predict(module, example), batch, desc=desc)
+        # results come back in batch order, so demos are recorded in the same order on every run.
+        for example, result in zip(batch, results):
+            self._record(module, example, *(result.value if result.ok else (None, [])))
+
+    def _bootstrap_one_example(self, module, example):
+        self._record(module, example, *self._traced_predict(module, example))
+
+    def _record(self, module, example, pred, trace):
+        if pred is not None and self.metric(example, pred):
             self.successful_examples.append(example)
+            record_trace_demos(module, trace, self.name2demos)
         else:
             self.failed_examples.append(example)
 
     def evaluate(self, module, valset):
-        correct = 0
-        for example in valset:
-            pred = module(example)
-            if self.metric(example, pred):
-                correct += 1
+        results = self.evaluator.run(lambda example: self._predict(module, example), valset, desc="Evaluating")
+        self.evaluator.print_stats()
+        correct = sum(1 for example, result in zip(valset, results) if result.ok and self.metric(example, result.value))
         return correct / len(valset)
 
 def initial_training(knowledge_master_module):
     print("Generating synthetic data...")
-    synthetic_trainset = generate_synthetic_data(num_samples=10)
+    synthetic_trainset = generate_synthetic_data(num_samples=10, output_path="local_cache/synthetic_knowledge_master_trainset.jsonl")
     print(f"Generated {len(synthetic_trainset)} synthetic examples")
 
     loaded_examples = handcrafted_examples
@@ -141,7 +165,7 @@ def initial_training(knowledge_master_module):
     save_model_state(compiled_knowledge_master, combined_trainset)
     return compiled_knowledge_master
 
-def save_model_state(compiled_model, trainset, filepath="knowledge_master_state.json"):
+def save_model_state(compiled_model, trainset, filepath=STATE_FILEPATH, program_filepath=PROGRAM_FILEPATH):
     state = {
         "model_class": compiled_model.__class__.__name__,
         "trainset": [
@@ -178,25 +202,34 @@ def save_model_state(compiled_model, trainset, filepath="knowledge_master_state.
     with open(filepath, 'w') as f:
         json.dump(state, f, indent=2)
     print(f"Model state saved to {filepath}")
+    save_compiled_program(compiled_model, program_filepath)
 
 def load_or_train_model(knowledge_master_module):
-    if os.path.exists("knowledge_master_state.json"):
+    if os.path.exists(PROGRAM_FILEPATH) and os.path.exists(STATE_FILEPATH):
+        try:
+            compiled_model = load_compiled_program(knowledge_master_module, PROGRAM_FILEPATH)
+            print("\n\nLoaded compiled program, skipping compilation.\n\n")
+            return compiled_model, load_trainset()
+        except ArtifactMismatchError as e:
+            print(f"Compiled program is stale ({e}). Recompiling...")
+
+    if os.path.exists(STATE_FILEPATH):
         print("\n\nLoading existing model state...\n\n")
-        return load_model_state(knowledge_master_module=knowledge_master_module)
+        compiled_model, trainset = load_model_state(knowledge_master_module=knowledge_master_module)
+        save_compiled_program(compiled_model, PROGRAM_FILEPATH)
+        return compiled_model, trainset
     else:
         print("No existing model state found. Performing initial training...")
         compiled_model = initial_training(knowledge_master_module=knowledge_master_module)
-        _, trainset = load_model_state(knowledge_master_module=knowledge_master_module)  # Load the trainset after saving
-        return compiled_model, trainset
+        return compiled_model, load_trainset()  # Load the trainset after saving
 
-@lru_cache(maxsize=1)
-def load_model_state(filepath="knowledge_master_state.json", knowledge_master_module=None):
+def load_trainset(filepath=STATE_FILEPATH):
     with open(filepath, 'r') as f:
         state = json.load(f)
 
     print(f"\n\nLOADED TRAINSET LENGTH: {len(state['trainset'])}")
 
-    loaded_trainset = [
+    return [
         dspy.Example(
             input_text=ex['input_text'],
             existing_knowledge=ex['existing_knowledge'],
@@ -219,33 +252,58 @@ def load_model_state(filepath="knowledge_master_state.json", knowledge_master_mo
         for ex in state['trainset']
     ]
 
+def load_model_state(filepath=STATE_FILEPATH, knowledge_master_module=None):
+    loaded_trainset = load_trainset(filepath)
+
     teleprompter = CustomBootstrapFewShot(metric=validate_knowledge_master)
     compiled_model = teleprompter.compile(knowledge_master_module(), trainset=loaded_trainset)
 
     return compiled_model, loaded_trainset
 
 class KnowledgeMasterTrainer:
+    program_filepath = PROGRAM_FILEPATH
+
     def __init__(self, KnowledgeMasterModule):
-        self.model, self.trainset = load_or_train_model(knowledge_master_module=KnowledgeMasterModule)
-        self.valset = self.create_validation_set()
+        self.module_class = KnowledgeMasterModule
+        self.versions = VersionedModel(*load_or_train_model(knowledge_master_module=KnowledgeMasterModule))
+        self._valset = None
+
+    @property
+    def model(self):
+        return self.versions.current.model
+
+    @property
+    def trainset(self):
+        return self.versions.current.trainset
+
+    @property
+    def valset(self):
+        # Generating the validation set costs one LLM call per sample, so only pay for it when evaluating.
+        if self._valset is None:
+            self._valset = self.create_validation_set()
+        return self._valset
 
     def process(self, input_text, existing_knowledge):
         prediction = self.model(input_text=input_text, existing_knowledge=existing_knowledge)
         return prediction["output"]
 
+    def build_candidate(self):
+        return load_model_state(knowledge_master_module=self.module_class)
+
+    def score(self, model):
+        return CustomBootstrapFewShot(metric=validate_knowledge_master).evaluate(model, self.valset)
+
     def retrain(self):
-        new_model, new_trainset = load_or_train_model(knowledge_master_module=self.model.__class__)
-        self.model = new_model
-        self.trainset = new_trainset
-        self.evaluate()
+        return RetrainingService({"knowledge_master": self}).retrain("knowledge_master")
 
     def evaluate(self):
-        teleprompter = CustomBootstrapFewShot(metric=validate_knowledge_master)
-        accuracy = teleprompter.evaluate(self.model, self.valset)
+        with lm_lane("training"):
+            accuracy = self.score(self.model)
         print(f"Current model accuracy: {accuracy:.2f}")
+        return accuracy
 
     def create_validation_set(self):
-        return generate_synthetic_data(num_samples=10)
+        return generate_synthetic_data(num_samples=10, output_path=HOLDOUT_FILEPATH, keep_output=True)
 
     def print_trainset(self):
         print("Current trainset:")
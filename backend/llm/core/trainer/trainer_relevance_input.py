@@ -6,6 +6,18 @@ import random
 import threading
 import time
 from tqdm import tqdm
+from llm.core.concurrency import get_executor, with_current_settings
+from llm.core.observability import metrics
+from llm.core.modules.relevance_module import BatchRelevanceModule
+from llm.core.trainer.synthetic import generate_concurrently
+from llm.core.trainer.parallel_eval import ParallelEvaluator
+from llm.core.trainer.retraining import VersionedModel, RetrainingService
+from llm.core.lm.scheduler import lm_lane
+from llm.core.trainer.artifacts import ArtifactMismatchError, load_compiled_program, save_compiled_program, record_trace_demos, install_demos
+
+STATE_FILEPATH = "relevance_classifier_state.json"
+PROGRAM_FILEPATH = "relevance_classifier_program.json"
+HOLDOUT_FILEPATH = "local_cache/relevance_holdout.jsonl"
 
 class SyntheticMessageGenerator(dspy.Signature):
     """Generate a synthetic user message for personal development, goals or life aspirations."""
@@ -13,7 +25,7 @@ class SyntheticMessageGenerator(dspy.Signature):
     context = dspy.InputField(desc="Additional context for message generation")
     message = dspy.OutputField(desc="A synthetic user message")
 
-def generate_synthetic_data(num_samples=50):
+def generate_synthetic_data(num_samples=50, workers=8, output_path=None, keep_output=False):
     generator = dspy.Predict(SyntheticMessageGenerator)
     synthetic_data = []
     categories = ['goal', 'task', 'journal', 'attribute', 'irrelevant']
@@ -23,13 +35,16 @@ def generate_synthetic_data(num_samples=50):
         "material possessions"
     ]
 
-    for _ in tqdm(range(num_samples), desc="Generating synthetic data"):
-        category = random.choice(categories)
-        context = random.choice(contexts)
-        result = generator(category=category, context=context)
+    jobs = [{"category": random.choice(categories), "context": random.choice(contexts)} for _ in range(num_samples)]
+    # some temperature so repeated (category, context) pairs don't all come back as the same message.
+    generate_one = lambda job: generator(category=job["category"], context=job["context"], config=dict(temperature=0.9)).message
+
+    for job, message in generate_concurrently(generate_one, jobs, workers=workers, output_path=output_path, keep_output=keep_output):
+        category = job["category"]
+        context = job["context"]
         relevance = "TRUE" if category != 'irrelevant' else "FALSE"
         example = dspy.Example(
-            input_text=result.message,
+            input_text=message,
             relevance=relevance,
             category=category,
             context=context
@@ -42,11 +57,13 @@ def validate_relevance(example, pred, trace=None):
     return example.relevance == pred.relevance
 
 class CustomBootstrapFewShot(BootstrapFewShot):
-    def __init__(self, metric):
+    def __init__(self, metric, num_workers=8, timeout=120):
         super().__init__(metric)
         self.successful_examples = []
         self.failed_examples = []
         self.bootstrapped_examples = []
+        self.name2demos = {}
+        self.evaluator = ParallelEvaluator(num_workers=num_workers, timeout=timeout)
 
     def compile(self, module, trainset, valset=None, max_rounds=3, max_traces=10, **config):
         print(f"Starting compilation with {len(trainset)} total examples")
@@ -57,17 +74,17 @@ class CustomBootstrapFewShot(BootstrapFewShot):
 
         for round in range(max_rounds):
             print(f"Starting round {round + 1}")
-            traces_this_round = 0
-            for _ in tqdm(range(max_traces), desc=f"Round {round + 1} traces"):
-                if not self.bootstrapped_examples:
-                    break
-                self.step(module)
-                traces_this_round += 1
-
-            print(f"Completed {traces_this_round} traces in round {round + 1}")
-            if traces_this_round == 0:
+            batch = self.bootstrapped_examples[:max_traces]
+            del self.bootstrapped_examples[:max_traces]
+            if batch:
+                self._bootstrap_batch(module, batch, desc=f"Round {round + 1} traces")
+
+            print(f"Completed {len(batch)} traces in round {round + 1}")
+            if len(batch) == 0:
                 break
 
+        install_demos(module, self.name2demos, self.max_bootstrapped_demos)
+
         # Evaluate on valset if provided
         if valset:
             accuracy = self.evaluate(module, valset)
@@ -82,26 +99,42 @@ class CustomBootstrapFewShot(BootstrapFewShot):
         else:
             print("No more examples to bootstrap.")
 
+    def _predict(self, module, example):
+        # only the input goes in, the labels stay on the example for the metric.
+        input_example = dspy.Example(input_text=example.input_text).with_inputs('input_text')
+        return module(input_example)
+
+    def _traced_predict(self, module, example):
+        # trace is a thread-local setting, so every worker collects only its own example's trace.
+        with dspy.settings.context(trace=[]):
+            pred = self._predict(module, example)
+            return pred, dspy.settings.trace
+
+    def _bootstrap_batch(self, module, batch, desc):
+        results = self.evaluator.run(lambda example: self._traced_predict(module, example), batch, desc=desc)
+        # results come back in batch order, so demos are recorded in the same order on every run.
+        for example, result in zip(batch, results):
+            self._record(module, example, *(result.value if result.ok else (None, [])))
+
     def _bootstrap_one_example(self, module, example):
-        input_text = example.input_text
-        input_example = dspy.Example(input_text=input_text).with_inputs('input_text')
-        pred = module(input_example)
-        if self.metric(example, pred):
+        self._record(module, example, *self._traced_predict(module, example))
+
+    def _record(self, module, example, pred, trace):
+        if pred is not None and self.metric(example, pred):
             self.successful_examples.append(example)
+            record_trace_demos(module, trace, self.name2demos)
         else:
             self.failed_examples.append(example)
 
     def evaluate(self, module, valset):
-        correct = 0
-        for example in valset:
-            pred = module(example)
-            if self.metric(example, pred):
-                correct += 1
+        results = self.evaluator.run(lambda example: self._predict(module, example), valset, desc="Evaluating")
+        self.evaluator.print_stats()
+        correct = sum(1 for example, result in zip(valset, results) if result.ok and self.metric(example, result.value))
         return correct / len(valset)
 
 def initial_training(relevance_module=any):
     print("Generating synthetic data...")
-    synthetic_trainset = generate_synthetic_data(num_samples=50)
+    synthetic_trainset = generate_synthetic_data(num_samples=50, output_path="local_cache/synthetic_relevance_trainset.jsonl")
     print(f"Generated {len(synthetic_trainset)} synthetic examples")
 
     original_trainset = [
@@ -139,7 +172,7 @@ def initial_training(relevance_module=any):
     save_model_state(compiled_relevance_detector, combined_trainset)
     return compiled_relevance_detector
 
-def save_model_state(compiled_model, trainset, filepath="relevance_classifier_state.json"):
+def save_model_state(compiled_model, trainset, filepath=STATE_FILEPATH, program_filepath=PROGRAM_FILEPATH):
     state = {
         "model_class": compiled_model.__class__.__name__,
         "trainset": [
@@ -150,58 +183,124 @@ def save_model_state(compiled_model, trainset, filepath="relevance_classifier_st
     with open(filepath, 'w') as f:
         json.dump(state, f, indent=2)
     print(f"Model state saved to {filepath}")
+    save_compiled_program(compiled_model, program_filepath)
 
 def load_or_train_model(relevance_module=any):
-    if os.path.exists("relevance_classifier_state.json"):
+    if os.path.exists(PROGRAM_FILEPATH) and os.path.exists(STATE_FILEPATH):
+        try:
+            compiled_model = load_compiled_program(relevance_module, PROGRAM_FILEPATH)
+            print("\n\nLoaded compiled program, skipping compilation.\n\n")
+            return compiled_model, load_trainset()
+        except ArtifactMismatchError as e:
+            print(f"Compiled program is stale ({e}). Recompiling...")
+
+    if os.path.exists(STATE_FILEPATH):
         print("\n\nLoading existing model state...\n\n")
-        return load_model_state(relevance_module=relevance_module)
+        compiled_model, trainset = load_model_state(relevance_module=relevance_module)
+        save_compiled_program(compiled_model, PROGRAM_FILEPATH)
+        return compiled_model, trainset
     else:
         print("No existing model state found. Performing initial training...")
         compiled_model = initial_training(relevance_module=relevance_module)
-        _, trainset = load_model_state(relevance_module=relevance_module)  # Load the trainset after saving
-        return compiled_model, trainset
+        return compiled_model, load_trainset()  # Load the trainset after saving
 
-def load_model_state(filepath="relevance_classifier_state.json", relevance_module=any):
+def load_trainset(filepath=STATE_FILEPATH):
     with open(filepath, 'r') as f:
         state = json.load(f)
 
-    loaded_trainset = [
+    return [
         dspy.Example(input_text=ex['input_text'], category=ex['category'], relevance=ex['relevance']).with_inputs('input_text', 'category')
         for ex in state['trainset']
     ]
 
+def load_model_state(filepath=STATE_FILEPATH, relevance_module=any):
+    loaded_trainset = load_trainset(filepath)
+
     teleprompter = CustomBootstrapFewShot(metric=validate_relevance)
     compiled_model = teleprompter.compile(relevance_module(), trainset=loaded_trainset)
 
     return compiled_model, loaded_trainset
 
 class RelevanceDetector:
+    program_filepath = PROGRAM_FILEPATH
+
     def __init__(self, RelevanceModule):
-        self.model, self.trainset = load_or_train_model(relevance_module=RelevanceModule)
-        self.lock = threading.Lock()
-        self.valset = self.create_validation_set()
+        self.module_class = RelevanceModule
+        self.versions = VersionedModel(*load_or_train_model(relevance_module=RelevanceModule))
+        self.batch_model = BatchRelevanceModule()
+        self._valset = None
+
+    # the live version is read once per call, a retrain swapping it mid-request never blocks or mixes versions.
+    @property
+    def model(self):
+        return self.versions.current.model
+
+    @property
+    def trainset(self):
+        return self.versions.current.trainset
+
+    @property
+    def valset(self):
+        # Generating the validation set costs one LLM call per sample, so only pay for it when evaluating.
+        if self._valset is None:
+            self._valset = self.create_validation_set()
+        return self._valset
 
     def classify(self, input_text):
-        with self.lock:
-            example = dspy.Example(input_text=input_text).with_inputs('input_text')
-            prediction = self.model(example)
-            return prediction.relevance, prediction.explanation
+        example = dspy.Example(input_text=input_text).with_inputs('input_text')
+        prediction = self.model(example)
+        return prediction.relevance, prediction.explanation
+
+    def classify_batch(self, inputs, batch_size=8, tokens_per_item=60):
+        """
+        Classify many inputs at once. Inputs are packed `batch_size` to a prompt (fewer if the LM's max_tokens
+        can't hold that many answers) and the chunks run concurrently on the shared LLM pool. Items the packed
+        answer doesn't cover are classified one by one with the compiled module.
+        Returns one Prediction(relevance, category, explanation) per input, in input order.
+        """
+        lm = dspy.settings.lm
+        max_tokens = getattr(lm, "kwargs", {}).get("max_tokens") or batch_size * tokens_per_item
+        chunk_size = max(1, min(batch_size, max_tokens // tokens_per_item))
+        model, batch_model = self.model, self.batch_model
+
+        def classify_chunk(chunk):
+            try:
+                results = batch_model(chunk) if len(chunk) > 1 else [None]
+            except Exception as e:
+                print(f"Batch classification failed, falling back to single calls: {e!r}")
+                results = [None] * len(chunk)
+
+            metrics.inc("mentor_relevance_batch_items_total", len(chunk) - results.count(None), help="Inputs classified by batched relevance calls", path="packed")
+            metrics.inc("mentor_relevance_batch_items_total", results.count(None), help="Inputs classified by batched relevance calls", path="single")
+            for i, result in enumerate(results):
+                if result is None:
+                    prediction = model(dspy.Example(input_text=chunk[i]).with_inputs('input_text'))
+                    results[i] = dspy.Prediction(relevance=prediction.relevance, category=prediction.category, explanation=prediction.explanation)
+            return results
+
+        chunks = [inputs[i:i + chunk_size] for i in range(0, len(inputs), chunk_size)]
+        futures = [get_executor().submit(with_current_settings(classify_chunk), chunk) for chunk in chunks]
+        return [result for future in futures for result in future.result()]
+
+    def build_candidate(self):
+        # a fresh compile from the saved trainset, nothing here touches the live version.
+        return load_model_state(relevance_module=self.module_class)
+
+    def score(self, model):
+        return CustomBootstrapFewShot(metric=validate_relevance).evaluate(model, self.valset)
 
     def retrain(self):
-        new_model, new_trainset = load_or_train_model()
-        with self.lock:
-            self.model = new_model
-            self.trainset = new_trainset
-        self.evaluate()
+        return RetrainingService({"relevance": self}).retrain("relevance")
 
     def evaluate(self):
-        teleprompter = CustomBootstrapFewShot(metric=validate_relevance)
-        accuracy = teleprompter.evaluate(self.model, self.valset)
+        with lm_lane("training"):
+            accuracy = self.score(self.model)
         print(f"Current model accuracy: {accuracy:.2f}")
+        return accuracy
 
     def create_validation_set(self):
-        # Create a small validation set
-        return generate_synthetic_data(num_samples=50)
+        # held-out set, written to disk the first time so every version is scored on the same examples.
+        return generate_synthetic_data(num_samples=50, output_path=HOLDOUT_FILEPATH, keep_output=True)
 
     def print_trainset(self):
         print("Current trainset:")
@@ -212,14 +311,5 @@ class RelevanceDetector:
             print()
 
 def periodic_retraining(detector, interval=86400):  # 86400 seconds = 1 day
-    while True:
-        time.sleep(interval)
-        print("Retraining model...")
-        detector.retrain()
-        print("Model retrained successfully.")
-
-
-# Start periodic retraining in a separate thread
-# retraining_thread = threading.Thread(target=periodic_retraining, args=(detector,))
-# retraining_thread.daemon = True
-# retraining_thread.start()
\ No newline at end of file
+    # compiles and validates on its own thread, the detector keeps serving the live version meanwhile.
+    return RetrainingService({"relevance": detector}, interval=interval).start()
\ No newline at end of file
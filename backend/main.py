@@ -1,11 +1,142 @@
 # File: backend/main.py
-from fastapi import FastAPI
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from typing import List
+from pydantic import BaseModel
 import uvicorn
+from llm.core.main_temp import app as graph, sessions, new_state, process_input, knowledge_queue
+from llm.core.sessions import DEFAULT_SESSION
+from llm.core.registry import registry
+from llm.core.serialization import to_jsonable
+from llm.core.observability import metrics
+from llm.core.trainer.retraining import RetrainingService
 
-app = FastAPI()
+# The graph is synchronous and every node can sit on a Groq call for seconds, so graph runs go to a
+# bounded pool instead of the event loop. Requests beyond GRAPH_WORKERS wait their turn in the pool.
+graph_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("GRAPH_WORKERS", 4)), thread_name_prefix="graph")
 
-# TODO: Implement API routes and main backend logic
+@asynccontextmanager
+async def lifespan(app):
+    # compile/load the detectors before the first request instead of during it.
+    await asyncio.get_running_loop().run_in_executor(graph_executor, registry.warm_up)
+    sessions.start_eviction()
+    if knowledge_queue is not None:
+        knowledge_queue.start()
+    retraining = None
+    if os.environ.get("RETRAIN_INTERVAL"):
+        # background retrain + held-out validation, requests keep using the live version until a swap.
+        retraining = RetrainingService({name: registry.get(name) for name in ("relevance", "knowledge_master")}, interval=float(os.environ["RETRAIN_INTERVAL"]))
+        retraining.start()
+    yield
+    if retraining:
+        retraining.stop()
+    if knowledge_queue is not None:
+        knowledge_queue.stop()
+    graph_executor.shutdown(wait=False, cancel_futures=True)
+    sessions.close_all()
+
+app = FastAPI(lifespan=lifespan)
+
+class MessageRequest(BaseModel):
+    text: str
+    session_id: str = DEFAULT_SESSION
+
+class RelevanceBatchRequest(BaseModel):
+    texts: List[str]
+
+def stream_graph(session_id, input_text, loop, queue):
+    # runs on the graph executor, hands every node update back to the event loop as it happens.
+    try:
+        with sessions.acquire(session_id) as session:
+            for update in graph.stream(new_state(session, input_text)):
+                for node, node_state in update.items():
+                    if node_state and node_state.get("messages"):
+                        session.messages = node_state["messages"]
+                    loop.call_soon_threadsafe(queue.put_nowait, ("node", {"node": node, "state": to_jsonable(node_state)}))
+        loop.call_soon_threadsafe(queue.put_nowait, ("done", {}))
+    except Exception as e:
+        loop.call_soon_threadsafe(queue.put_nowait, ("error", {"error": repr(e)}))
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def session_or_400(session_id):
+    try:
+        return sessions.get(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/messages")
+async def post_message(request: MessageRequest):
+    session_or_400(request.session_id)
+    final_state = await asyncio.get_running_loop().run_in_executor(graph_executor, process_input, request.text, request.session_id)
+    return {
+        "relevance": final_state.get("relevance"),
+        "final_response": final_state.get("final_response"),
+        "analyzer_response": to_jsonable(final_state.get("analyzer_response")),
+    }
+
+@app.post("/messages/stream")
+async def stream_message(request: MessageRequest):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    session_or_400(request.session_id)
+    loop.run_in_executor(graph_executor, stream_graph, request.session_id, request.text, loop, queue)
+
+    async def events():
+        while True:
+            event, data = await queue.get()
+            yield sse_event(event, data)
+            if event in ("done", "error"):
+                break
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/relevance/batch")
+async def classify_relevance_batch(request: RelevanceBatchRequest):
+    # importing a backlog of journal entries, classified in packed prompts instead of one call each.
+    detector = registry.get("relevance")
+    results = await asyncio.get_running_loop().run_in_executor(graph_executor, detector.classify_batch, request.texts)
+    return [
+        {"text": text, "relevance": result.relevance, "category": result.category, "explanation": result.explanation}
+        for text, result in zip(request.texts, results)
+    ]
+
+@app.get("/memory")
+async def get_memory(response: Response, session_id: str = DEFAULT_SESSION, category: str = None, status: str = None):
+    session_or_400(session_id)
+
+    def read():
+        if knowledge_queue is not None:
+            # read-your-writes: knowledge from messages this user already sent is applied before we answer.
+            if not knowledge_queue.wait_for(session_id, timeout=float(os.environ.get("MEMORY_READ_WAIT", 30))):
+                # still behind: answer with what we have, but say so (202 + how many jobs are outstanding).
+                response.status_code = 202
+                response.headers["X-Memory-Pending"] = str(knowledge_queue.pending(session_id))
+        # looked up after the wait, the session may have been evicted and reopened meanwhile.
+        memory_store = sessions.get(session_id).memory
+        if category and status:
+            # the category index narrows it down, status is checked on what's left.
+            return [entry for entry in memory_store.by_category(category) if entry.get("status") == status]
+        if category:
+            return memory_store.by_category(category)
+        if status:
+            return memory_store.by_status(status)
+        return memory_store.all()
+
+    # plain store reads, kept off the graph pool so they never queue behind slow LLM runs.
+    return await asyncio.get_running_loop().run_in_executor(None, read)
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text format, scrape this endpoint.
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)